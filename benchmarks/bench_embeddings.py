@@ -0,0 +1,177 @@
+"""Compare embedding backends on throughput, memory and retrieval agreement.
+
+Every backend runs in its own process so its memory is measured in
+isolation. The corpus is the chunked text of the recorded HTML fixtures,
+padded with numbered copies up to ``--texts`` chunks. Agreement is
+measured against the first backend listed (by default the current
+full-precision PyTorch model): the mean overlap of each query's top-k
+chunks and the mean Spearman correlation of the query's scores.
+
+    python benchmarks/bench_embeddings.py --backends torch torch:int8 torch:d256 \\
+        --texts 512 --output embed_results.json
+
+A backend is written as ``torch[:int8][:d<dim>]``. The int8 backend is
+experimental.
+"""
+import sys
+import os
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(project_root)
+
+import argparse
+import html
+import json
+import multiprocessing
+import platform
+import re
+import resource
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from benchmarks.servers import load_fixtures
+from search_agent.similarity_model.chunker import TextChunker
+from search_agent.similarity_model.embedding_backends import EmbeddingBackendConfig, load_embedding_model
+
+QUERIES = [
+    "current population of Japan",
+    "Japan birth rate and number of births",
+    "population of the Greater Tokyo Area",
+    "number of foreign residents in Japan",
+    "life expectancy in Japan",
+    "economic growth and GDP",
+]
+_PARAGRAPH = re.compile(r"<p[^>]*>(.*?)</p>", re.S)
+_TAG = re.compile(r"<[^>]+>")
+
+
+def parse_backend(spec: str) -> EmbeddingBackendConfig:
+    backend, *options = spec.split(":")
+    quantize = "int8" in options
+    dims = [int(option[1:]) for option in options if re.fullmatch(r"d\d+", option)]
+    return EmbeddingBackendConfig(backend=backend, quantize=quantize, truncate_dim=dims[0] if dims else None)
+
+
+def build_corpus(count: int, chunk_size: int) -> List[str]:
+    paragraphs = [html.unescape(_TAG.sub("", p)).strip()
+                  for page in load_fixtures().values() for p in _PARAGRAPH.findall(page)]
+    text = "\n\n".join(p for p in paragraphs if p)
+    chunks = TextChunker(max_chunk_size=chunk_size, overlap_sentences=2).chunk_text(text)
+    corpus = []
+    section = 0
+    while len(corpus) < count:
+        corpus.extend(f"Section {section}. {chunk}" if section else chunk for chunk in chunks)
+        section += 1
+    return corpus[:count]
+
+
+def rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+
+
+def run_backend(model_name: str, spec: str, corpus: List[str], batch_size: int, repeats: int) -> Dict:
+    """Runs in a child process: load one backend, encode the corpus, score the queries."""
+    baseline = rss_mb()
+    start = time.perf_counter()
+    model = load_embedding_model(model_name, parse_backend(spec))
+    load_s = time.perf_counter() - start
+    loaded = rss_mb()
+
+    model.encode(corpus[:batch_size], task="text-matching", batch_size=batch_size)  # warm-up
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        doc_embs = model.encode(corpus, task="text-matching", batch_size=batch_size)
+        timings.append(time.perf_counter() - start)
+    query_embs = model.encode(QUERIES, task="text-matching", batch_size=batch_size)
+
+    def normalize(x):
+        x = np.asarray(x, dtype=np.float32)
+        return x / np.maximum(np.linalg.norm(x, axis=1, keepdims=True), 1e-12)
+
+    scores = normalize(query_embs) @ normalize(doc_embs).T
+    best = min(timings)
+    return {
+        "backend": spec,
+        "dim": int(doc_embs.shape[1]),
+        "load_s": load_s,
+        "encode_s": best,
+        "throughput_texts_per_s": len(corpus) / best if best else 0.0,
+        "model_rss_mb": loaded - baseline,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "scores": scores.tolist(),
+    }
+
+
+def _ranks(values: np.ndarray) -> np.ndarray:
+    ranks = np.empty(len(values))
+    ranks[np.argsort(values)] = np.arange(len(values))
+    return ranks
+
+
+def agreement(reference: np.ndarray, candidate: np.ndarray, top_k: int) -> Dict[str, float]:
+    overlaps, correlations = [], []
+    for ref, cand in zip(reference, candidate):
+        ref_top = set(np.argsort(-ref)[:top_k])
+        cand_top = set(np.argsort(-cand)[:top_k])
+        overlaps.append(len(ref_top & cand_top) / top_k)
+        correlations.append(float(np.corrcoef(_ranks(ref), _ranks(cand))[0, 1]))
+    return {"top_k_overlap": float(np.mean(overlaps)), "spearman": float(np.mean(correlations))}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--embed-model", default="jinaai/jina-embeddings-v3")
+    parser.add_argument("--backends", nargs="+", default=["torch", "torch:int8", "torch:d256"],
+                        help="the first backend is the reference for agreement")
+    parser.add_argument("--texts", type=int, default=512, help="number of chunks to embed")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--repeats", type=int, default=3, help="timed passes over the corpus; the fastest counts")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--output", default="embed_results.json")
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.texts, args.chunk_size)
+    ctx = multiprocessing.get_context("spawn")
+    results = []
+    for spec in args.backends:
+        parse_backend(spec)
+        with ctx.Pool(1) as pool:
+            try:
+                result = pool.apply(run_backend, (args.embed_model, spec, corpus, args.batch_size, args.repeats))
+            except Exception as e:
+                print(f"{spec:<16} failed: {type(e).__name__}: {e}")
+                continue
+        results.append(result)
+
+    if results:
+        reference = np.array(results[0]["scores"])
+        print(f"\n{'backend':<16} {'dim':>5} {'texts/s':>9} {'model MB':>9} {'peak MB':>9} "
+              f"{'top-k':>6} {'spearman':>8}  (agreement with {results[0]['backend']})")
+        for result in results:
+            result.update(agreement(reference, np.array(result.pop("scores")), args.top_k))
+            print(f"{result['backend']:<16} {result['dim']:>5} {result['throughput_texts_per_s']:>9.1f} "
+                  f"{result['model_rss_mb']:>9.0f} {result['peak_rss_mb']:>9.0f} "
+                  f"{result['top_k_overlap']:>6.2f} {result['spearman']:>8.3f}")
+
+    output = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": vars(args),
+        },
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(output, f, indent=2)
+    print(f"\nWrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""Offline stage-by-stage benchmark of the retrieval pipeline.
+
+Everything runs against local stand-ins: a fake Serper endpoint, an HTTP
+server serving the recorded HTML fixtures (scaled to the requested page
+sizes) and a fake Ollama chat endpoint. Pages are still rendered by the
+real crawler. Each query goes through the public ``OpenDeepSearchTool.run``
+path, and stage timings are read from the tracer spans it records.
+Embeddings come from a small deterministic hashing model unless
+``--embed-model`` names a SentenceTransformer model.
+
+    python benchmarks/bench_pipeline.py --sizes 20000 200000 --concurrency 1 4 \\
+        --iterations 8 --output bench_results.json
+    python benchmarks/bench_pipeline.py --output new.json --compare bench_results.json
+"""
+import sys
+import os
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(project_root)
+
+import argparse
+import json
+import platform
+import re
+import resource
+import time
+import tracemalloc
+import zlib
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from benchmarks.servers import (load_fixtures, start_fixture_server,
+                                start_ollama_server, start_serper_server)
+from search_agent.context_building.process_build_context import ProcessBuildContext
+from search_agent.search_tool import OpenDeepSearchTool
+from search_agent.tracing import InMemorySink, NullSink, Span, set_sink
+# Importable once process_build_context has put the search_agent directory on sys.path.
+from context_scraping.scrape import MultiURLCrawler
+from search.serper_search import create_search_api
+from similarity_model.similarity_search import SimilaritySearch
+
+# Tracer spans that make up each reported stage.
+STAGE_SPANS = {
+    "search": ("search.request",),
+    "crawl": ("crawl",),
+    "clean_chunk": ("chunk", "resolve"),
+    "lexical": ("lexical",),
+    "embed": ("embed.query", "embed.batch"),
+    "rank": ("rank",),
+    "answer": ("llm.call",),
+    "end_to_end": ("search_tool.run",),
+}
+QUERIES = [
+    "current population of Japan",
+    "Japan birth rate and number of births",
+    "population of the Greater Tokyo Area",
+    "number of foreign residents in Japan",
+]
+
+
+class HashingEmbedder:
+    """Small deterministic embedding model: hashed unigrams and bigrams."""
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    def encode(self, texts: List[str], task: Optional[str] = None, **kwargs) -> np.ndarray:
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            tokens = re.findall(r"\w+", text.lower())
+            for token in tokens + [a + " " + b for a, b in zip(tokens, tokens[1:])]:
+                out[row, zlib.crc32(token.encode("utf-8")) % self.dim] += 1.0
+        return out
+
+
+def build_tool(args) -> OpenDeepSearchTool:
+    model = None if args.embed_model else HashingEmbedder()
+    sim_search = SimilaritySearch(model_name=args.embed_model or "hashing-384", model=model)
+    builder = ProcessBuildContext(
+        chunk_size=args.chunk_size,
+        overlap_sentences=args.overlap_sentences,
+        sim_search=sim_search,
+        search_api=create_search_api("offline-benchmark", cache_ttl=None),
+        crawler=MultiURLCrawler(page_cache=None, max_concurrent_pages=args.max_pages),
+    )
+    return OpenDeepSearchTool(top_k=args.top_k, llm_model="benchmark", builder=builder)
+
+
+def stage_durations(spans: List[Span]) -> Dict[str, List[float]]:
+    """Per-stage milliseconds for each traced query.
+
+    Pages are cleaned, chunked and embedded while the rest are still being
+    crawled, so a stage's time is the sum of its spans within one trace
+    and the stages of a query do not add up to its end-to-end time.
+    """
+    totals: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+    for span in spans:
+        for stage, names in STAGE_SPANS.items():
+            if span.name in names:
+                totals[span.trace_id][stage] += span.duration_ms
+    durations: Dict[str, List[float]] = defaultdict(list)
+    for per_stage in totals.values():
+        for stage, ms in per_stage.items():
+            durations[stage].append(ms)
+    return durations
+
+
+def summarize(durations: List[float]) -> Dict[str, float]:
+    values = np.array(durations)
+    return {
+        "count": int(values.size),
+        "mean_ms": float(values.mean()),
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+    }
+
+
+def run_level(tool: OpenDeepSearchTool, iterations: int, concurrency: int) -> Dict:
+    sink = InMemorySink()
+    set_sink(sink)
+    queries = [QUERIES[i % len(QUERIES)] for i in range(iterations)]
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(tool.run, queries))
+    finally:
+        set_sink(NullSink())
+    wall = time.perf_counter() - start
+    return {
+        "wall_s": wall,
+        "throughput_qps": iterations / wall if wall else 0.0,
+        "stages": {name: summarize(values) for name, values in stage_durations(sink.spans).items()},
+    }
+
+
+def profile_memory(tool: OpenDeepSearchTool) -> int:
+    """Peak bytes allocated by Python while answering one query."""
+    tracemalloc.start()
+    try:
+        tool.run(QUERIES[0])
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def compare(current: Dict, previous: Dict) -> None:
+    def index(results):
+        return {(r["doc_size"], r["concurrency"]): r for r in results["results"]}
+
+    before = index(previous)
+    print(f"\n{'size':>9} {'conc':>4} {'stage':<11} {'p50 before':>11} {'p50 now':>10} {'change':>8}")
+    for key, result in sorted(index(current).items()):
+        if key not in before:
+            continue
+        old_stages = before[key]["stages"]
+        for name, stats in result["stages"].items():
+            if name not in old_stages:
+                continue
+            old = old_stages[name]["p50_ms"]
+            change = (stats["p50_ms"] - old) / old * 100 if old else 0.0
+            print(f"{key[0]:>9} {key[1]:>4} {name:<11} {old:>11.2f} {stats['p50_ms']:>10.2f} {change:>+7.1f}%")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[20_000, 200_000],
+                        help="approximate HTML size of each crawled page in bytes")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--iterations", type=int, default=8, help="queries per size and concurrency level")
+    parser.add_argument("--chunk-size", type=int, default=1500)
+    parser.add_argument("--overlap-sentences", type=int, default=2)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--max-pages", type=int, default=8, help="crawler max concurrent pages")
+    parser.add_argument("--embed-model", default=None, help="SentenceTransformer model instead of the hashing model")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="seconds the fake LLM waits before answering")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", default=None, help="previous results file to compare against")
+    args = parser.parse_args()
+
+    fixtures = load_fixtures()
+    pages = start_fixture_server(fixtures)
+    serper = start_serper_server(fixtures, pages.url)
+    ollama = start_ollama_server(latency=args.llm_latency)
+    os.environ["SERPER_API_URL"] = f"{serper.url}/search"
+    os.environ["OLLAMA_HOST"] = ollama.url
+
+    tool = build_tool(args)
+    results = []
+    try:
+        for size in args.sizes:
+            serper.doc_size = size
+            tool.run(QUERIES[0])  # warm-up: browser start, model load
+            peak_mem_kb = profile_memory(tool) / 1024
+            for concurrency in args.concurrency:
+                level = run_level(tool, args.iterations, concurrency)
+                results.append(dict(level, doc_size=size, concurrency=concurrency, peak_mem_kb=peak_mem_kb))
+                e2e = level["stages"]["end_to_end"]
+                print(f"size={size:>8} concurrency={concurrency:>2} "
+                      f"end_to_end p50={e2e['p50_ms']:.1f}ms p95={e2e['p95_ms']:.1f}ms "
+                      f"throughput={level['throughput_qps']:.2f} q/s peak={peak_mem_kb:.1f}KB")
+                for name in STAGE_SPANS:
+                    stats = level["stages"].get(name)
+                    if stats and name != "end_to_end":
+                        print(f"    {name:<11} p50={stats['p50_ms']:9.2f}ms p95={stats['p95_ms']:9.2f}ms")
+    finally:
+        tool.builder.crawler.close()
+        for server in (pages, serper, ollama):
+            server.close()
+
+    output = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": vars(args),
+            "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        },
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(output, f, indent=2)
+    print(f"\nWrote {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(output, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+import json
+import os
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Type
+from urllib.parse import parse_qs, urlsplit
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+_PARAGRAPH = re.compile(r"<p>(.*?)</p>", re.S)
+_TITLE = re.compile(r"<title>(.*?)</title>", re.S)
+
+
+class LocalServer:
+    """A ThreadingHTTPServer running on a daemon thread on 127.0.0.1."""
+
+    def __init__(self, handler: Type[BaseHTTPRequestHandler]):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_port}"
+
+    def close(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class _QuietHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args) -> None:
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self) -> Dict:
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+
+def load_fixtures(fixtures_dir: str = FIXTURES_DIR) -> Dict[str, str]:
+    fixtures = {}
+    for name in sorted(os.listdir(fixtures_dir)):
+        if name.endswith(".html"):
+            with open(os.path.join(fixtures_dir, name), encoding="utf-8") as f:
+                fixtures[name] = f.read()
+    return fixtures
+
+
+def scale_html(html: str, size: int) -> str:
+    """Pad a fixture with numbered copies of its paragraphs up to ``size`` bytes."""
+    paragraphs = _PARAGRAPH.findall(html)
+    if not paragraphs or len(html) >= size:
+        return html
+    filler: List[str] = []
+    total = len(html)
+    section = 0
+    while total < size:
+        section += 1
+        for text in paragraphs:
+            block = f"<p>Section {section}. {text}</p>\n"
+            filler.append(block)
+            total += len(block)
+    return html.replace("</body>", "<section>\n" + "".join(filler) + "</section>\n</body>")
+
+
+def start_fixture_server(fixtures: Dict[str, str]) -> LocalServer:
+    """Serve ``/<fixture>.html?size=<bytes>`` from the recorded HTML fixtures."""
+
+    class Handler(_QuietHandler):
+        def do_GET(self) -> None:
+            parts = urlsplit(self.path)
+            html = fixtures.get(parts.path.lstrip("/"))
+            if html is None:
+                self._send(404, b"not found", "text/plain")
+                return
+            size = int(parse_qs(parts.query).get("size", ["0"])[0])
+            self._send(200, scale_html(html, size).encode("utf-8"), "text/html; charset=utf-8")
+
+    return LocalServer(Handler)
+
+
+def start_serper_server(fixtures: Dict[str, str], page_base_url: str) -> LocalServer:
+    """Stand-in for the Serper search endpoint.
+
+    Results point at the fixture server; set ``server.doc_size`` to change
+    the size of the pages they link to.
+    """
+
+    class Handler(_QuietHandler):
+        def do_POST(self) -> None:
+            payload = self._read_json()
+            num = int(payload.get("num", 10))
+            organic = []
+            for position, (name, html) in enumerate(fixtures.items(), start=1):
+                if position > num:
+                    break
+                title = _TITLE.search(html)
+                snippet = _PARAGRAPH.search(html)
+                organic.append({
+                    "title": title.group(1).strip() if title else name,
+                    "link": f"{page_base_url}/{name}?size={server.doc_size}",
+                    "snippet": re.sub(r"\s+", " ", snippet.group(1)).strip()[:160] if snippet else "",
+                    "position": position,
+                })
+            body = {"searchParameters": payload, "organic": organic}
+            self._send(200, json.dumps(body).encode("utf-8"), "application/json")
+
+    server = LocalServer(Handler)
+    server.doc_size = 0
+    return server
+
+
+def start_ollama_server(answer: str = "Japan has about 123 million people.", latency: float = 0.0) -> LocalServer:
+    """Stand-in for the Ollama ``/api/chat`` endpoint returning a canned answer."""
+
+    class Handler(_QuietHandler):
+        def do_GET(self) -> None:
+            self._send(200, b"Ollama is running", "text/plain")
+
+        def do_POST(self) -> None:
+            payload = self._read_json()
+            if latency:
+                time.sleep(latency)
+            model = payload.get("model", "")
+            created_at = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+            done = {
+                "model": model, "created_at": created_at,
+                "message": {"role": "assistant", "content": "" if payload.get("stream", True) else answer},
+                "done": True, "done_reason": "stop",
+                "total_duration": 0, "load_duration": 0,
+                "prompt_eval_count": 0, "prompt_eval_duration": 0,
+                "eval_count": len(answer.split()), "eval_duration": 0,
+            }
+            if not payload.get("stream", True):
+                self._send(200, json.dumps(done).encode("utf-8"), "application/json")
+                return
+            lines = [
+                json.dumps({"model": model, "created_at": created_at,
+                            "message": {"role": "assistant", "content": token}, "done": False})
+                for token in re.findall(r"\S+\s*", answer)
+            ]
+            lines.append(json.dumps(done))
+            self._send(200, ("\n".join(lines) + "\n").encode("utf-8"), "application/x-ndjson")
+
+    return LocalServer(Handler)
@@ -1,21 +1,67 @@
+import os
+
 import gradio as gr
+from search_agent import registry
 from search_agent.react_agent import ReActAgent
 from search_agent.codeact_agent import CodeActAgent
+from search_agent.serving import AgentServer, ServerBusy
+from search_agent.streaming import FINAL_ANSWER, OBSERVATION, THOUGHT, TOKEN, TOOL_START, TOOL_TOKEN
+
+
+MAX_WORKERS = int(os.getenv("AGENT_WORKERS", "4"))
+MAX_QUEUE = int(os.getenv("AGENT_QUEUE", "16"))
+
+server = AgentServer(
+    {
+        'ReAct': lambda: ReActAgent(model_name="qwen2.5:14b-instruct-q8_0", temperature=0.3, verbose=False),
+        'CodeAct': lambda: CodeActAgent(model_name="gemini-2.0-flash", verbose=False),
+    },
+    max_workers=MAX_WORKERS,
+    max_queue=MAX_QUEUE,
+)
 
 
+def render_events(steps, streaming):
+    parts = list(steps)
+    if streaming:
+        parts.append(streaming + " ▌")
+    return "\n\n".join(parts)
 
-react_agent = ReActAgent(model_name="qwen2.5:14b-instruct-q8_0", temperature=0.3)
-codeact_agent = CodeActAgent(model_name="gemini-2.0-flash", verbose=True)
 
+def route_message(agent_name, message, chat_history, request: gr.Request):
+    chat_history = list(chat_history or [])
+    try:
+        events = server.stream(request.session_hash, agent_name, message)
+    except ServerBusy:
+        chat_history.append((message, "The server is busy, please try again in a moment."))
+        yield chat_history, chat_history
+        return
+    chat_history.append((message, "…"))
+    yield chat_history, chat_history
 
-def route_message(agent_name, message, chat_history):
-    if agent_name == 'ReAct':
-        response = react_agent.run(message)
-    else:
-        response = codeact_agent.run(message)
-    chat_history = chat_history or []
-    chat_history.append((message, response))
-    return chat_history, chat_history
+    steps = []
+    streaming = ""
+    for event in events:
+        if event.type in (TOKEN, TOOL_TOKEN):
+            streaming += event.content
+            chat_history[-1] = (message, render_events(steps, streaming))
+            yield chat_history, chat_history
+            continue
+        streaming = ""
+        if event.type == THOUGHT:
+            steps.append(f"💭 *{event.content}*")
+        elif event.type == TOOL_START:
+            steps.append(f"🔧 `{event.data['tool']}`: {event.content}")
+        elif event.type == OBSERVATION:
+            steps.append(f"👁️ {event.content}")
+        elif event.type == FINAL_ANSWER:
+            steps.append(f"**{event.content}**")
+        chat_history[-1] = (message, render_events(steps, streaming))
+        yield chat_history, chat_history
+
+
+def server_stats():
+    return server.stats()
 
 
 with gr.Blocks() as demo:
@@ -37,13 +83,23 @@ with gr.Blocks() as demo:
         )
         send_btn = gr.Button("Send")
 
+    with gr.Accordion("Server stats", open=False):
+        stats = gr.JSON(label="Throughput and queue wait (seconds)")
+        stats_btn = gr.Button("Refresh")
+
     
     send_btn.click(
         fn=route_message,
         inputs=[agent_selector, user_input, state],
-        outputs=[chatbot, state]
+        outputs=[chatbot, state],
+        concurrency_limit=None
     )
+    stats_btn.click(fn=server_stats, outputs=stats)
 
 if __name__ == "__main__":
+    registry.warm_up(ollama_models=["qwen2.5:14b-instruct-q8_0"])
+    # AgentServer bounds concurrency and queueing itself; Gradio only caps
+    # how many requests may wait in its own queue in front of it.
+    demo.queue(max_size=MAX_WORKERS + MAX_QUEUE)
     demo.launch()
 
@@ -1,12 +1,122 @@
+import ast
 import math
+import operator
 import re
-from typing import Any, Dict
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Union
+
+Number = Union[int, float]
+
+_MAX_EXPONENT = 10_000
+# Largest power allowed, in bits (about 30,000 decimal digits).
+_MAX_RESULT_BITS = 100_000
+_MAX_FACTORIAL = 1_000
+
+
+def _safe_pow(base: Number, exponent: Number) -> Number:
+    if abs(exponent) > _MAX_EXPONENT:
+        raise ValueError("Exponent too large")
+    # Bound the size of the result before computing it; this also covers
+    # nested powers, whose inner result is the outer base.
+    base_bits = abs(base).bit_length() if isinstance(base, int) else math.frexp(abs(base))[1]
+    if exponent > 0 and base_bits * exponent > _MAX_RESULT_BITS:
+        raise ValueError("Result too large")
+    try:
+        return operator.pow(base, exponent)
+    except OverflowError:
+        raise ValueError("Result too large")
+
+
+def _safe_factorial(value: Number) -> int:
+    if value > _MAX_FACTORIAL:
+        raise ValueError("Factorial argument too large")
+    return math.factorial(int(value)) if float(value).is_integer() else math.gamma(value + 1)
+
+
+_FUNCTIONS: Dict[str, Callable[..., Number]] = {
+    name: getattr(math, name)
+    for name in ("sqrt", "exp", "log", "log10", "log2", "sin", "cos", "tan", "asin", "acos", "atan",
+                 "atan2", "sinh", "cosh", "tanh", "floor", "ceil", "trunc", "degrees", "radians",
+                 "hypot", "fabs", "gcd")
+}
+_FUNCTIONS.update(abs=abs, round=round, min=min, max=max, pow=_safe_pow, factorial=_safe_factorial)
+_CONSTANTS: Dict[str, Number] = {"pi": math.pi, "e": math.e, "tau": math.tau, "inf": math.inf}
+
+# "1,127" is a number, while the comma in "max(1, 2)" separates arguments.
+_THOUSANDS_SEPARATOR = re.compile(r"(?<=\d),(?=\d{3}(?!\d))")
+
+_BINARY_OPS = (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow)
+_UNARY_OPS = (ast.UAdd, ast.USub)
+
+
+class _Compiler(ast.NodeTransformer):
+    """Rejects anything outside the arithmetic whitelist and routes ``**`` through _safe_pow."""
+
+    def generic_visit(self, node):
+        raise ValueError(f"Unsupported syntax: {type(node).__name__}")
+
+    def visit_Expression(self, node):
+        node.body = self.visit(node.body)
+        return node
+
+    def visit_Constant(self, node):
+        if isinstance(node.value, bool) or not isinstance(node.value, (int, float)):
+            raise ValueError(f"Unsupported constant: {node.value!r}")
+        return node
+
+    def visit_BinOp(self, node):
+        if not isinstance(node.op, _BINARY_OPS):
+            raise ValueError(f"Unsupported operator: {type(node.op).__name__}")
+        left, right = self.visit(node.left), self.visit(node.right)
+        if isinstance(node.op, ast.Pow):
+            return ast.copy_location(
+                ast.Call(func=ast.Name(id="pow", ctx=ast.Load()), args=[left, right], keywords=[]), node
+            )
+        node.left, node.right = left, right
+        return node
+
+    def visit_UnaryOp(self, node):
+        if not isinstance(node.op, _UNARY_OPS):
+            raise ValueError(f"Unsupported operator: {type(node.op).__name__}")
+        node.operand = self.visit(node.operand)
+        return node
+
+    def visit_Name(self, node):
+        if node.id not in _CONSTANTS and node.id not in _FUNCTIONS:
+            raise ValueError(f"Unknown name: {node.id}")
+        return node
+
+    def visit_Attribute(self, node):
+        # math.sqrt(2) is accepted as sqrt(2).
+        if isinstance(node.value, ast.Name) and node.value.id == "math":
+            return self.visit_Name(ast.copy_location(ast.Name(id=node.attr, ctx=ast.Load()), node))
+        raise ValueError("Unsupported attribute access")
+
+    def visit_Call(self, node):
+        if not isinstance(node.func, (ast.Name, ast.Attribute)) or node.keywords:
+            raise ValueError("Unsupported function call")
+        node.func = self.visit(node.func)
+        if node.func.id not in _FUNCTIONS:
+            raise ValueError(f"Unknown function: {node.func.id}")
+        node.args = [self.visit(arg) for arg in node.args]
+        return node
+
+
+@lru_cache(maxsize=4096)
+def compile_expression(expr: str) -> Callable[[], Number]:
+    """Parse and validate ``expr`` once; the result evaluates it without re-parsing."""
+    tree = _Compiler().visit(ast.parse(expr.strip(), mode="eval"))
+    code = compile(ast.fix_missing_locations(tree), "<calculate>", "eval")
+    namespace = {"__builtins__": {}, **_FUNCTIONS, **_CONSTANTS}
+    return lambda: eval(code, namespace)
+
 
 class CalculateTool:
     name = "calculate"
     description ="""Performs mathematical calculations and evaluations of expressions.
-        Supports basic arithmetic operations, absolute values, commas in numbers,
-        and multiple sub-expressions separated by 'and'."""
+        Supports basic arithmetic operations, powers, absolute values, commas in numbers,
+        math functions such as sqrt, log, round, min and max, and multiple
+        sub-expressions separated by 'and' or by new lines."""
     inputs = "expression to calculate"
     output_type = "string"
 
@@ -16,13 +126,11 @@ class CalculateTool:
             if not isinstance(expression, str):
                 raise ValueError("Expression must be a string")
 
-            expr = expression.replace(",", "")
-            abs_pattern = r"\|([^|]+)\|"
-            segments = re.findall(abs_pattern, expr)
-            for seg in segments:
-                val = CalculateTool._safe_eval(seg)
-                expr = expr.replace(f"|{seg}|", str(abs(val)))
+            lines = [line for line in expression.splitlines() if line.strip()]
+            if len(lines) > 1:
+                return "\n".join(CalculateTool.execute_many(lines))
 
+            expr = CalculateTool._normalize(expression)
             if " and " in expr:
                 parts = expr.split(" and ")
                 results = [str(CalculateTool._safe_eval(p)) for p in parts]
@@ -34,15 +142,18 @@ class CalculateTool:
             return f"Error evaluating expression: {e}"
 
     @staticmethod
-    def _safe_eval(expr: str) -> float:
-        expr = expr.replace("×", "*").replace("÷", "/")
-        allowed = set("0123456789.+-*/() ")
-        if not all(c in allowed for c in expr):
-            raise ValueError("Expression contains invalid characters")
-        for kw in ("__", "import", "eval", "exec", "compile"):
-            if kw in expr:
-                raise ValueError("Unsafe expression")
-        return eval(expr)
+    def execute_many(expressions: List[str]) -> List[str]:
+        """Evaluate each expression; errors are reported per expression."""
+        return [CalculateTool.execute(expression) for expression in expressions]
+
+    @staticmethod
+    def _normalize(expression: str) -> str:
+        expr = _THOUSANDS_SEPARATOR.sub("", expression).replace("×", "*").replace("÷", "/").replace("^", "**")
+        return re.sub(r"\|([^|]+)\|", r"abs(\1)", expr)
+
+    @staticmethod
+    def _safe_eval(expr: str) -> Any:
+        return compile_expression(expr)()
 
 # if __name__ == "__main__":
 #     tests = [
@@ -1,15 +1,24 @@
 import google.generativeai as genai
 import dotenv
+import itertools
 import re
 import os
+import sys
+import threading
+import traceback
 from .codeact_prompt import codeact_prompt
-from .search_tool import OpenDeepSearchTool
+from . import registry
+from .memory import estimate_tokens, fit_to_budget
+from .sandbox import Sandbox, SandboxPool
+from .streaming import (AgentEvent, FINAL_ANSWER, OBSERVATION, THOUGHT, TOKEN, TOOL_END,
+                        TOOL_START, iter_in_context)
+from .tracing import token_usage, tracer
 from google import genai
+from google.genai import errors as genai_errors
 from google.genai import types
-from typing import Dict, List, Tuple, Any, Optional, Mapping
-from IPython.core.interactiveshell import InteractiveShell
-from IPython.utils import io
-from dataclasses import dataclass
+from typing import Dict, Generator, Iterator, List, Tuple, Any, Optional, Mapping, Union
+from contextlib import contextmanager
+from io import StringIO
 dotenv.load_dotenv()
 
 def final_answer(text: str) -> str:
@@ -17,32 +26,71 @@ def final_answer(text: str) -> str:
 
 tools={
     "final_answer": final_answer,
-    "search_tool": OpenDeepSearchTool(
+    "search_tool": registry.get_search_tool(
         serper_api_key=os.getenv('SERPER_API_KEY'),
         top_k=5,
         temperature=0.3
     )
 }
 
+class _ThreadLocalStdout:
+    """sys.stdout replacement that sends each thread's writes to its own buffer while capturing."""
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._local = threading.local()
+
+    def write(self, text: str) -> int:
+        buffer = getattr(self._local, "buffer", None)
+        return (buffer or self._stream).write(text)
+
+    def flush(self) -> None:
+        buffer = getattr(self._local, "buffer", None)
+        (buffer or self._stream).flush()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+    @contextmanager
+    def capture(self) -> Iterator[StringIO]:
+        previous = getattr(self._local, "buffer", None)
+        self._local.buffer = StringIO()
+        try:
+            yield self._local.buffer
+        finally:
+            self._local.buffer = previous
+
+
+_stdout_lock = threading.Lock()
+
+
+def _capture_stdout():
+    with _stdout_lock:
+        if not isinstance(sys.stdout, _ThreadLocalStdout):
+            sys.stdout = _ThreadLocalStdout(sys.stdout)
+        return sys.stdout.capture()
+
+
 class PythonREPL:
-    def __init__(self, code: str, user_namespace: Mapping[str, Any]):
+    """Runs code in ``user_namespace``, which persists between cells.
+
+    Each agent owns its namespace, and output is captured per thread, so
+    agents serving different sessions can execute code concurrently.
+    """
+
+    def __init__(self, code: str, user_namespace: Dict[str, Any]):
         self.code = code
         self.user_namespace = user_namespace
-        self.shell = InteractiveShell.instance(
-            user_ns=dict(self.user_namespace),
-            colors="NoColor",
-        )
     def reset(self) -> None:
-        self.shell.clear_instance()
+        self.user_namespace.clear()
     def execute(self) -> str:
         try:
-            with io.capture_output() as captured:
-                _ = self.shell.run_cell(
-                    self.code,
-                    silent= True,
-                    store_history=False,
-                )
-            output = captured.stdout
+            with _capture_stdout() as captured:
+                try:
+                    exec(compile(self.code, "<cell>", "exec"), self.user_namespace)
+                except Exception:
+                    traceback.print_exc(file=sys.stdout)
+            output = captured.getvalue()
             if output == "":
                 output = "[Executed Successfully with No Output]"
             return output
@@ -51,12 +99,46 @@ class PythonREPL:
 
 
 class CodeActAgent:
-    def __init__(self, model_name: str = "gemini-2.0-flash", tools: Mapping[str, Any] = tools, verbose: bool = True):
+    # Context caches for the system prompt, shared by every agent: (model, prompt) -> cache name or None.
+    _prefix_caches: Dict[Tuple[str, str], Optional[str]] = {}
+    _prefix_cache_lock = threading.Lock()
+
+    def __init__(self, model_name: str = "gemini-2.0-flash", tools: Mapping[str, Any] = tools, verbose: bool = True,
+                 use_sandbox: bool = True, sandbox_pool: Optional[SandboxPool] = None,
+                 history_token_budget: Optional[int] = 8000, keep_recent_observations: int = 2,
+                 use_context_cache: bool = True, context_cache_ttl: str = "3600s"):
         self.model_name = model_name
-        self.model = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+        self.model = registry.get_genai_client(os.getenv("GEMINI_API_KEY"))
         self.system_prompt = codeact_prompt
         self.tools = tools
+        self.namespace: Dict[str, Any] = dict(tools)
         self.verbose = verbose
+        self.use_sandbox = use_sandbox
+        self._sandbox_pool = sandbox_pool
+        self.history_token_budget = history_token_budget
+        self.keep_recent_observations = keep_recent_observations
+        self.use_context_cache = use_context_cache
+        self.context_cache_ttl = context_cache_ttl
+
+    @property
+    def sandbox_pool(self) -> SandboxPool:
+        if self._sandbox_pool is None:
+            self._sandbox_pool = registry.get_sandbox_pool() if self.tools is tools else SandboxPool(self.tools)
+        return self._sandbox_pool
+
+    @contextmanager
+    def _code_session(self) -> Iterator[Optional[Sandbox]]:
+        """Lease a sandbox worker whose variables persist for the rest of the run.
+
+        Without a sandbox, code runs in ``self.namespace``, which starts
+        each run with only the tools.
+        """
+        if not self.use_sandbox:
+            self.namespace = dict(self.tools)
+            yield None
+            return
+        with self.sandbox_pool.session() as sandbox:
+            yield sandbox
     
     def _parse_response(self, response: str) -> Dict[str, Optional[str]]:
         thought_match = re.search(r'Thought:\s*(.*?)(?=Code:|Observation:|Final Answer:|$)', response, re.DOTALL)
@@ -91,21 +173,149 @@ class CodeActAgent:
             formatted_steps.append(step)
         return "\n".join(formatted_steps)
     
-    def execute_code(self, code: str) -> Dict[str, Any]:
-        try:
-            repl = PythonREPL(code, self.tools)
-            output = repl.execute()
-            return {
-                'success': True,
-                'output': output,
-                'error': None
-            }
-        except Exception as e:
-            return {
-                'success': False,
-                'output': None,
-                'error': str(e)
-            }
+    def _cached_prefix(self) -> Optional[str]:
+        """Name of a context cache holding the system prompt, or None if caching is unavailable."""
+        key = (self.model_name, self.system_prompt)
+        with self._prefix_cache_lock:
+            if key not in self._prefix_caches:
+                try:
+                    cache = self.model.caches.create(
+                        model=self.model_name,
+                        config=types.CreateCachedContentConfig(
+                            system_instruction=self.system_prompt,
+                            ttl=self.context_cache_ttl,
+                        ),
+                    )
+                    self._prefix_caches[key] = cache.name
+                except Exception as e:
+                    if self.verbose:
+                        print(f"Context caching unavailable, sending the system prompt inline: {e}")
+                    if not self._is_rejection(e):
+                        # Transient failure (rate limit, network): try again on the next call.
+                        return None
+                    # Models without caching, or prompts below the minimum cacheable size.
+                    self._prefix_caches[key] = None
+            return self._prefix_caches[key]
+
+    @staticmethod
+    def _is_rejection(e: Exception) -> bool:
+        """A client error that retrying the same request will not fix (rate limits excluded)."""
+        return isinstance(e, genai_errors.ClientError) and e.code != 429
+
+    def _is_cache_error(self, e: Exception) -> bool:
+        """Whether a request failed because of its context cache (expired, missing or rejected)."""
+        return self._is_rejection(e) and (e.code == 404 or "cache" in str(e).lower())
+
+    def _generation_config(self) -> types.GenerateContentConfig:
+        cache_name = self._cached_prefix() if self.use_context_cache else None
+        if cache_name:
+            return types.GenerateContentConfig(cached_content=cache_name)
+        return self._inline_config()
+
+    def _inline_config(self) -> types.GenerateContentConfig:
+        return types.GenerateContentConfig(system_instruction=self.system_prompt)
+
+    def _drop_cached_prefix(self, e: Exception) -> None:
+        """Forget a cache the API no longer accepts.
+
+        An expired or deleted cache (404) is recreated on the next call; a
+        cache the API rejects otherwise is not used again for this prompt.
+        """
+        key = (self.model_name, self.system_prompt)
+        with self._prefix_cache_lock:
+            if e.code == 404:
+                self._prefix_caches.pop(key, None)
+            else:
+                self._prefix_caches[key] = None
+
+    @staticmethod
+    def _as_contents(contents: Union[str, List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        if isinstance(contents, str):
+            return [{'role': 'user', 'parts': [{'text': contents}]}]
+        return contents
+
+    @staticmethod
+    def _contents_tokens(contents: List[Dict[str, Any]]) -> int:
+        return sum(estimate_tokens(part['text']) for turn in contents for part in turn['parts'])
+
+    def _generate(self, contents: Union[str, List[Dict[str, Any]]]):
+        contents = self._as_contents(contents)
+        with tracer.span("llm.call", model=self.model_name, turns=len(contents),
+                         estimated_input_tokens=self._contents_tokens(contents)) as span:
+            config = self._generation_config()
+            try:
+                response = self.model.models.generate_content(
+                    model=self.model_name, contents=contents, config=config
+                )
+            except Exception as e:
+                if not config.cached_content or not self._is_cache_error(e):
+                    raise
+                self._drop_cached_prefix(e)
+                response = self.model.models.generate_content(
+                    model=self.model_name, contents=contents, config=self._inline_config()
+                )
+            span.set(**token_usage(response))
+            return response
+
+    def _generate_text(self, contents: Union[str, List[Dict[str, Any]]], stream: bool) -> Generator[AgentEvent, None, str]:
+        """Response text; when streaming, yields a token event per chunk first."""
+        if not stream:
+            return self._generate(contents).candidates[0].content.parts[0].text
+        contents = self._as_contents(contents)
+        with tracer.span("llm.call", model=self.model_name, turns=len(contents), stream=True,
+                         estimated_input_tokens=self._contents_tokens(contents)) as span:
+            parts = []
+            chunk = None
+            config = self._generation_config()
+            try:
+                chunks = iter(self.model.models.generate_content_stream(
+                    model=self.model_name, contents=contents, config=config
+                ))
+                first = next(chunks, None)
+            except Exception as e:
+                if not config.cached_content or not self._is_cache_error(e):
+                    raise
+                self._drop_cached_prefix(e)
+                chunks = iter(self.model.models.generate_content_stream(
+                    model=self.model_name, contents=contents, config=self._inline_config()
+                ))
+                first = next(chunks, None)
+            for chunk in itertools.chain([first] if first is not None else [], chunks):
+                if chunk.text:
+                    parts.append(chunk.text)
+                    yield AgentEvent(TOKEN, chunk.text)
+            span.set(**token_usage(chunk))
+            return "".join(parts)
+
+    def execute_code(self, code: str, sandbox: Optional[Sandbox] = None) -> Dict[str, Any]:
+        with tracer.span("code.execute", code_chars=len(code), sandboxed=sandbox is not None) as span:
+            if sandbox is not None:
+                result = sandbox.execute(code)
+                output = result.output
+                if result.success and output == "":
+                    output = "[Executed Successfully with No Output]"
+                span.set(output_chars=len(output or ""), timed_out=result.timed_out, error=result.error)
+                return {
+                    'success': result.success,
+                    'output': output,
+                    'error': result.error
+                }
+            try:
+                repl = PythonREPL(code, self.namespace)
+                output = repl.execute()
+                span.set(output_chars=len(output))
+                return {
+                    'success': True,
+                    'output': output,
+                    'error': None
+                }
+            except Exception as e:
+                span.set(error=str(e))
+                return {
+                    'success': False,
+                    'output': None,
+                    'error': str(e)
+                }
     
     def _print_step(self, iteration: int, thought: str = "", code: str = "", observation: str = "", is_final: bool = False):
         if not self.verbose:
@@ -134,39 +344,54 @@ class CodeActAgent:
             print()
     
     def run(self, user_question: str, max_iterations: int = 5) -> str:
+        with tracer.trace("codeact.run", model=self.model_name, question_chars=len(user_question)), \
+                self._code_session() as sandbox:
+            answer = None
+            for event in self._steps(user_question, max_iterations, sandbox, stream=False):
+                if event.type == FINAL_ANSWER:
+                    answer = event.content
+            return answer
+
+    def run_stream(self, user_question: str, max_iterations: int = 5) -> Iterator[AgentEvent]:
+        """Like ``run``, but yields AgentEvents as the run progresses."""
+        return iter_in_context(self._traced_stream(user_question, max_iterations))
+
+    def _traced_stream(self, user_question: str, max_iterations: int) -> Iterator[AgentEvent]:
+        with tracer.trace("codeact.run", model=self.model_name, question_chars=len(user_question), stream=True), \
+                self._code_session() as sandbox:
+            yield from self._steps(user_question, max_iterations, sandbox, stream=True)
+
+    def _steps(self, user_question: str, max_iterations: int, sandbox: Optional[Sandbox],
+               stream: bool) -> Iterator[AgentEvent]:
         if self.verbose:
             print(f"\n🚀 Starting CodeAct Agent")
             print(f"📝 Question: {user_question}")
             print(f"🔄 Max iterations: {max_iterations}")
         
         intermediate_steps = []
-        current_prompt = f"{self.system_prompt}\n\nQuestion: {user_question}\n\nPlease start by thinking about this step by step."
+        # (model response, observation or None for a step without code)
+        turns: List[Tuple[str, Optional[str]]] = []
         
         for iteration in range(max_iterations):
             try:
                 if self.verbose:
                     print(f"\n🔄 Generating response for iteration {iteration + 1}...")
                 
-                response = self.model.models.generate_content(
-                    model=self.model_name,
-                    contents=[{
-                        'role': 'user',
-                        'parts': [{'text': current_prompt}]
-                    }]
-                )
-                
-                response_text = response.candidates[0].content.parts[0].text
+                response_text = yield from self._generate_text(self._build_contents(user_question, turns), stream)
                 parsed = self._parse_response(response_text)
                 
                 thought = parsed.get('thought', '')
                 code = parsed.get('code', '')
+                if thought:
+                    yield AgentEvent(THOUGHT, thought, {"iteration": iteration + 1})
                 
                
                 if parsed.get('final_answer'):
                     if self.verbose:
                         print(f"\n🎯 FINAL ANSWER RECEIVED:")
                         print(f"   {parsed['final_answer']}")
-                    return parsed['final_answer']
+                    yield AgentEvent(FINAL_ANSWER, parsed['final_answer'], {"iterations": iteration + 1})
+                    return
                 
               
                 if code and not parsed.get('is_final', False):
@@ -176,7 +401,10 @@ class CodeActAgent:
                     if self.verbose:
                         print("⚡ Executing code...")
                     
-                    execution_result = self.execute_code(code)
+                    yield AgentEvent(TOOL_START, code, {"tool": "python", "iteration": iteration + 1})
+                    execution_result = self.execute_code(code, sandbox)
+                    yield AgentEvent(TOOL_END, "", {"tool": "python", "iteration": iteration + 1,
+                                                    "success": execution_result['success']})
                     
                     if execution_result['success']:
                         observation = execution_result['output']
@@ -187,13 +415,11 @@ class CodeActAgent:
                     if self.verbose:
                         print(f"👁️  OBSERVATION:")
                         print(f"   {observation}")
+                    yield AgentEvent(OBSERVATION, observation, {"tool": "python", "iteration": iteration + 1})
                     
             
                     intermediate_steps.append((thought, code, observation))
-                    
-                   
-                    history = self._format_intermediate_steps(intermediate_steps)
-                    current_prompt = f"{self.system_prompt}\n\nQuestion: {user_question}\n\n{history}\n\nWhat should I do next?"
+                    turns.append((response_text, observation))
                 
                 elif code and parsed.get('is_final', False):
               
@@ -202,43 +428,70 @@ class CodeActAgent:
                     if self.verbose:
                         print("🏁 Executing final code...")
                     
-                    execution_result = self.execute_code(code)
+                    yield AgentEvent(TOOL_START, code, {"tool": "python", "iteration": iteration + 1})
+                    execution_result = self.execute_code(code, sandbox)
+                    yield AgentEvent(TOOL_END, "", {"tool": "python", "iteration": iteration + 1,
+                                                    "success": execution_result['success']})
                     if execution_result['success']:
                         if self.verbose:
                             print(f"✅ Final execution successful!")
                             print(f"🎯 RESULT: {execution_result['output']}")
-                        return execution_result['output']
+                        yield AgentEvent(FINAL_ANSWER, execution_result['output'], {"iterations": iteration + 1})
+                        return
                     else:
                         error_msg = f"Error in final answer: {execution_result['error']}"
                         if self.verbose:
                             print(f"❌ Final execution failed: {error_msg}")
-                        return error_msg
+                        yield AgentEvent(FINAL_ANSWER, error_msg, {"iterations": iteration + 1, "error": True})
+                        return
                 
                 else:
                     self._print_step(iteration, thought, "", "", False)
                     
                     if thought:
                         intermediate_steps.append((thought, '', ''))
-                        history = self._format_intermediate_steps(intermediate_steps)
-                        current_prompt = f"{self.system_prompt}\n\nQuestion: {user_question}\n\n{history}\n\nPlease provide code to execute or a final answer."
+                        turns.append((response_text, None))
             
             except Exception as e:
                 error_msg = f"Error during execution: {str(e)}"
                 if self.verbose:
                     print(f"❌ {error_msg}")
-                return error_msg
+                yield AgentEvent(FINAL_ANSWER, error_msg, {"iterations": iteration + 1, "error": True})
+                return
         
         if self.verbose:
             print(f"\n⚠️  Reached maximum iterations ({max_iterations}). Synthesizing final answer...")
         
-        return self._synthesize_from_history(user_question, intermediate_steps, thought)
+        answer = yield from self._synthesize_from_history(user_question, intermediate_steps, thought, stream)
+        yield AgentEvent(FINAL_ANSWER, answer, {"iterations": max_iterations})
     
-    def _synthesize_from_history(self, original_question: str, action_history: List[Tuple[str, str, str]], last_thought: str) -> str:
-        history_summary = self._format_intermediate_steps(action_history)
+    def _build_contents(self, user_question: str, turns: List[Tuple[str, Optional[str]]]) -> List[Dict[str, Any]]:
+        """Multi-turn history with older observations shrunk to the token budget."""
+        observations = fit_to_budget(
+            [observation for _, observation in turns if observation is not None],
+            self.history_token_budget,
+            keep_recent=self.keep_recent_observations,
+        )
+        contents = [{'role': 'user', 'parts': [{'text': f"Question: {user_question}\n\nPlease start by thinking about this step by step."}]}]
+        fitted = iter(observations)
+        for response_text, observation in turns:
+            if observation is None:
+                follow_up = "Please provide code to execute or a final answer."
+            else:
+                follow_up = f"Observation: {next(fitted)}\n\nWhat should I do next?"
+            contents.append({'role': 'model', 'parts': [{'text': response_text}]})
+            contents.append({'role': 'user', 'parts': [{'text': follow_up}]})
+        return contents
+
+    def _synthesize_from_history(self, original_question: str, action_history: List[Tuple[str, str, str]], last_thought: str,
+                                 stream: bool = False) -> Generator[AgentEvent, None, str]:
+        observations = fit_to_budget([observation for _, _, observation in action_history],
+                                     self.history_token_budget, keep_recent=self.keep_recent_observations)
+        history_summary = self._format_intermediate_steps(
+            [(thought, code, observation) for (thought, code, _), observation in zip(action_history, observations)]
+        )
         
         synthesis_prompt = f"""
-        {self.system_prompt}
-        
         Original Question: {original_question}
         
         Here's what I've tried so far:
@@ -256,15 +509,7 @@ class CodeActAgent:
             if self.verbose:
                 print("🔄 Generating synthesis response...")
             
-            response = self.model.models.generate_content(
-                model=self.model_name,
-                contents=[{
-                    'role': 'user',
-                    'parts': [{'text': synthesis_prompt}]
-                }]
-            )
-            
-            response_text = response.candidates[0].content.parts[0].text
+            response_text = yield from self._generate_text(synthesis_prompt, stream)
             parsed = self._parse_response(response_text)
             
             final_answer = parsed.get('final_answer', response_text)
@@ -0,0 +1,167 @@
+import re
+from dataclasses import dataclass, field
+from typing import Iterator, List, Optional, Pattern, Set, Tuple
+
+_INLINE_FENCE = re.compile(r"```.*?```")
+# A dash or underscore between two letters or digits ("state-of-the-art",
+# "user_name") is part of a word; anywhere else it is markup.
+_LOOSE_DASH = r"[-_](?<![^\W_][-_](?=[^\W_]))"
+# Everything a block loses to markup, in one pattern so that a block is
+# cleaned in a single scan: an image, a link (group 1 is its text), a
+# table rule line ("|---|:-:|") or a loose dash.
+# Every alternative starts with a fixed character, which lets the regex
+# engine skip ahead to the next candidate instead of trying each position.
+_MARKUP = re.compile(r"!\[[^\]]*\]\([^)]*\)|\[([^\]]*)\]\([^)]*\)|\|(?<![^\n]\|)[ \t|:-]*$|" + _LOOSE_DASH, re.M)
+_MARKUP_CHARS = frozenset("[|-_")
+_BLANK_LINE = re.compile(r"\n[ \t]*\n")
+_STRIP_CHARS = str.maketrans("", "", "#>*`")
+
+# A short block made only of site chrome ("Sign in | Register", "Subscribe to
+# our newsletter", "© 2024 Example Inc. All rights reserved.") or opening
+# with a cookie notice. It is matched against the whole block, so a
+# paragraph that merely mentions cookies or signing in is kept.
+DEFAULT_BOILERPLATE = re.compile(
+    r"(?:this (?:web ?)?site|we) uses? cookies.*|"
+    r"(?:accept(?: all)?(?: cookies)?|reject all|(?:manage )?cookie (?:settings|preferences|policy)|"
+    r"privacy policy|terms of (?:use|service)|(?:©|copyright) [^.|]{0,80}|all rights reserved|"
+    r"subscribe(?: to (?:our|the) newsletter)?|(?:sign up for )?(?:our |the )?newsletter|"
+    r"sign in|log in|log out|sign up|register|skip to (?:main )?content|"
+    r"share(?: this(?: article| page)?| on \w+)?|follow us(?: on \w+)?|advertisement|"
+    r"[\s|·•,.:;!/-])+",
+    re.IGNORECASE,
+)
+# Chrome words that, in a block made largely of links, mark it as a banner
+# ("Share on Facebook Twitter", "We use cookies. Accept Privacy policy").
+DEFAULT_BANNER_WORDS = re.compile(
+    r"cookie|consent|privacy|subscribe|newsletter|sign in|log in|sign up|share|follow us|advertisement",
+    re.IGNORECASE,
+)
+
+
+@dataclass
+class NormalizedText:
+    text: str
+    input_chars: int
+    boilerplate_chars: int
+    # The kept blocks; ``text`` is them joined and escaped for the prompt template.
+    blocks: List[str] = field(default_factory=list)
+
+    @property
+    def removed_chars(self) -> int:
+        """Characters the cleaning removed, measured before ``text`` was escaped."""
+        return self.input_chars - (sum(map(len, self.blocks)) + max(len(self.blocks) - 1, 0))
+
+
+class MarkdownNormalizer:
+    """Turns crawled markdown into plain text in one pass over its blocks.
+
+    The document is read block by block (blocks end at blank lines) and
+    each block is cleaned as it is read, with one regex scan: code fences
+    are dropped, links are reduced to their text and markdown markup is
+    stripped. A block is
+    dropped as boilerplate when most of its text is link text (menus,
+    footers, related-article lists), when it is a short banner (cookie
+    notices, share and subscribe prompts), or, when a ``seen`` set is
+    given, when a short block already appeared on another page of the same
+    build (repeated site chrome). A block repeated within one page is kept.
+
+    A short block is a banner when ``boilerplate`` matches all of it, or
+    when it contains one of the ``banner_words`` and at least
+    ``banner_link_density`` of its text is link text. Body text that
+    merely mentions cookies or signing in is kept.
+    """
+
+    def __init__(self,
+                 max_link_density: float = 0.5,
+                 min_links: int = 3,
+                 short_block_chars: int = 400,
+                 boilerplate: Optional[Pattern] = DEFAULT_BOILERPLATE,
+                 banner_words: Optional[Pattern] = DEFAULT_BANNER_WORDS,
+                 banner_link_density: float = 0.4):
+        self.max_link_density = max_link_density
+        self.min_links = min_links
+        self.short_block_chars = short_block_chars
+        self.boilerplate = boilerplate
+        self.banner_words = banner_words
+        self.banner_link_density = banner_link_density
+
+    def normalize(self, md: str, seen: Optional[Set[str]] = None) -> NormalizedText:
+        """Clean ``md``; ``seen`` carries the short blocks of earlier pages of one build (see ``drop_repeats``)."""
+        kept: List[str] = []
+        dropped = 0
+        for block, boilerplate in self.iter_blocks(md):
+            if boilerplate:
+                dropped += len(block)
+            else:
+                kept.append(block)
+        cleaned = self._result(kept, len(md), dropped)
+        return cleaned if seen is None else self.drop_repeats(cleaned, seen)
+
+    def drop_repeats(self, cleaned: NormalizedText, seen: Set[str]) -> NormalizedText:
+        """Drop the short blocks of ``cleaned`` that are in ``seen``, then add its own short blocks to it.
+
+        Pages cleaned on their own can be resolved later, in a fixed page
+        order, so that the first page to show a repeated block keeps it.
+        """
+        own = {block.lower() for block in cleaned.blocks if len(block) <= self.short_block_chars}
+        repeated = own & seen
+        seen |= own
+        if not repeated:
+            return cleaned
+        kept = [block for block in cleaned.blocks if block.lower() not in repeated]
+        dropped = sum(len(block) for block in cleaned.blocks) - sum(map(len, kept))
+        return self._result(kept, cleaned.input_chars, cleaned.boilerplate_chars + dropped)
+
+    @staticmethod
+    def _result(blocks: List[str], input_chars: int, boilerplate_chars: int) -> NormalizedText:
+        text = " ".join(blocks).replace("{", "{{").replace("}", "}}")
+        return NormalizedText(text=text, input_chars=input_chars, boilerplate_chars=boilerplate_chars, blocks=blocks)
+
+    def iter_blocks(self, md: str) -> Iterator[Tuple[str, bool]]:
+        """Yield ``(text, is_boilerplate)`` for each non-empty block of ``md`` in order."""
+        in_fence = False
+        for block in _BLANK_LINE.split(md):
+            if in_fence or "```" in block:
+                lines = []
+                for line in block.split("\n"):
+                    line, in_fence = self._strip_fences(line, in_fence)
+                    lines.append(line)
+                block = "\n".join(lines)
+            block = block.translate(_STRIP_CHARS)
+            links = link_chars = 0
+            if not _MARKUP_CHARS.isdisjoint(block):
+                # Split on every piece of markup: the odd items are link
+                # texts, or None where an image, rule or loose dash was cut.
+                pieces = _MARKUP.split(block)
+                if len(pieces) > 1:
+                    texts = pieces[1::2]
+                    links = len(texts) - texts.count(None)
+                    link_chars = sum(map(len, filter(None, texts)))
+                    block = "".join(filter(None, pieces))
+            block = " ".join(block.split())
+            if block:
+                yield self._finish(block, links, link_chars)
+
+    @staticmethod
+    def _strip_fences(line: str, in_fence: bool) -> Tuple[str, bool]:
+        if "```" not in line:
+            return ("" if in_fence else line), in_fence
+        if in_fence:
+            line = line.split("```", 1)[1]
+            in_fence = False
+        line = _INLINE_FENCE.sub("", line)
+        if "```" in line:
+            line = line.split("```", 1)[0]
+            in_fence = True
+        return line, in_fence
+
+    def _finish(self, block: str, links: int, link_chars: int) -> Tuple[str, bool]:
+        if links >= self.min_links and link_chars > self.max_link_density * len(block):
+            return block, True
+        if len(block) <= self.short_block_chars:
+            if self.boilerplate is not None and self.boilerplate.fullmatch(block):
+                return block, True
+            if (self.banner_words is not None and links
+                    and link_chars >= self.banner_link_density * len(block) and self.banner_words.search(block)):
+                return block, True
+        return block, False
@@ -6,11 +6,42 @@ project_root = os.path.abspath(os.path.join(current_dir, '..'))
 sys.path.append(project_root)
 
 import asyncio
-import re
-from context_scraping.scrape import MultiURLCrawler
-from search.serper_search import create_search_api
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+from search_agent.tracing import tracer
+from search_agent.context_building.markdown_normalizer import MarkdownNormalizer, NormalizedText
+from context_scraping.scrape import MultiURLCrawler, PageResult
+from context_scraping.page_cache import PageCache
+from search.serper_search import SearchAPI, create_search_api
 from similarity_model.similarity_search import SimilaritySearch
 from similarity_model.chunker import TextChunker
+from similarity_model.dedup import NearDuplicateFilter
+from similarity_model.lexical import BM25Index, fuse_scores, top_n_ids
+from similarity_model.embedding_backends import EmbeddingBackendConfig
+from similarity_model.embedding_cache import EmbeddingCache, default_cache_path
+from similarity_model.knowledge_index import KnowledgeIndex
+
+def run_sync(coro):
+    """Run ``coro`` to completion from synchronous code and return its result."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    # Called from inside a running event loop (e.g. an async Gradio
+    # handler): run the coroutine on a private loop in another thread.
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(contextvars.copy_context().run, asyncio.run, coro).result()
+
+
+@dataclass
+class ContextResult:
+    context: str
+    metadata: Dict[str, Any] = field(default_factory=dict)
+
 
 class ProcessBuildContext:
 
@@ -19,48 +50,565 @@ class ProcessBuildContext:
                  overlap_sentences: int = 4,
                  embed_model_name: str = 'jinaai/jina-embeddings-v3',
                  serper_api_key: str = None,
+                 use_page_cache: bool = True,
+                 page_cache: Optional[PageCache] = None,
+                 use_embedding_cache: bool = True,
+                 embedding_cache: Optional[EmbeddingCache] = None,
+                 search_cache_ttl: Optional[float] = 300.0,
+                 sim_search: Optional[SimilaritySearch] = None,
+                 search_api: Optional[SearchAPI] = None,
+                 crawler: Optional[MultiURLCrawler] = None,
+                 knowledge_index: Optional[KnowledgeIndex] = None,
+                 local_min_hits: int = 3,
+                 local_min_score: float = 0.6,
+                 local_max_age: Optional[float] = 7 * 24 * 3600,
+                 normalizer: Optional[MarkdownNormalizer] = None,
+                 dedup_threshold: Optional[float] = 0.8,
+                 lexical_top_n: Optional[int] = None,
+                 lexical_weight: float = 0.0,
+                 adaptive: bool = False,
+                 snippet_threshold: float = 0.6,
+                 snippet_min_hits: int = 2,
+                 chunk_threshold: float = 0.6,
+                 crawl_wave: int = 1,
+                 embedding_backend: Optional[EmbeddingBackendConfig] = None,
                 ):
 
         self.chunker = TextChunker(max_chunk_size=chunk_size,
                                    overlap_sentences=overlap_sentences)
-        self.sim_search = SimilaritySearch(model_name=embed_model_name)
-        self.search_api = create_search_api(serper_api_key)
-        self.crawler = MultiURLCrawler()
+        if sim_search is None:
+            embedding_backend = embedding_backend or EmbeddingBackendConfig()
+            if use_embedding_cache and embedding_cache is None:
+                embedding_cache = EmbeddingCache(default_cache_path(embedding_backend.model_id(embed_model_name)))
+            sim_search = SimilaritySearch(model_name=embed_model_name,
+                                          embedding_cache=embedding_cache if use_embedding_cache else None,
+                                          backend=embedding_backend)
+        self.sim_search = sim_search
+        self.search_api = search_api or create_search_api(serper_api_key, cache_ttl=search_cache_ttl)
+        if crawler is None:
+            if use_page_cache and page_cache is None:
+                page_cache = PageCache()
+            crawler = MultiURLCrawler(page_cache=page_cache if use_page_cache else None)
+        self.crawler = crawler
+        self.knowledge_index = knowledge_index
+        self.local_min_hits = local_min_hits
+        self.local_min_score = local_min_score
+        self.local_max_age = local_max_age
+        self.normalizer = normalizer or MarkdownNormalizer()
+        # Shingle similarity at which two chunks count as copies; None keeps every chunk.
+        self.dedup_threshold = dedup_threshold
+        # With lexical_top_n, only that many BM25 candidates per query are
+        # embedded, and pages cut down that way stay out of the knowledge index.
+        self.lexical_top_n = lexical_top_n
+        self.lexical_weight = lexical_weight
+        # Adaptive retrieval: answer from search snippets when enough of them
+        # score above snippet_threshold, otherwise crawl crawl_wave URLs at a
+        # time in snippet order until top_k chunks score above chunk_threshold.
+        self.adaptive = adaptive
+        self.snippet_threshold = snippet_threshold
+        self.snippet_min_hits = snippet_min_hits
+        self.chunk_threshold = chunk_threshold
+        self.crawl_wave = max(1, crawl_wave)
 
     def build_context(self,
                       user_query: str,
-                      top_k: int = 5) -> list[tuple[str, float]]:
-        docs = []
-        result = self.search_api.get_sources(user_query, num_results=3, stored_location="us")
-        urls = []
-        if result.success:
-            organic = result.data.get('organic', [])
+                      top_k: int = 5) -> str:
+        return run_sync(self.abuild_context(user_query, top_k))
+
+    async def abuild_context(self,
+                             user_query: str,
+                             top_k: int = 5) -> str:
+        return (await self.abuild_context_result(user_query, top_k)).context
+
+    def build_context_result(self,
+                             user_query: str,
+                             top_k: int = 5) -> ContextResult:
+        return run_sync(self.abuild_context_result(user_query, top_k))
+
+    async def abuild_context_result(self,
+                                    user_query: str,
+                                    top_k: int = 5) -> ContextResult:
+        """Build the context for one query, with metadata on how it was retrieved.
+
+        ``metadata["mode"]`` is ``"local"`` (answered from the knowledge
+        index), ``"snippets"`` (answered from search snippets, adaptive
+        mode only) or ``"crawl"``.
+        """
+        with tracer.span("build_context", query_chars=len(user_query), top_k=top_k) as build_span:
+            query_emb = asyncio.create_task(asyncio.to_thread(self._embed_query, user_query))
+            if self.knowledge_index is not None:
+                local = await asyncio.to_thread(self._search_local, await query_emb, top_k)
+                build_span.set(source="local" if local else "web")
+                if local:
+                    return ContextResult(self._combine_content(local), {"mode": "local"})
+
+            if self.adaptive:
+                try:
+                    result = await self._adaptive_context(user_query, top_k, query_emb)
+                except BaseException:
+                    query_emb.cancel()
+                    raise
+                build_span.set(mode=result.metadata["mode"], crawled=len(result.metadata["crawled"]),
+                               context_chars=len(result.context))
+                return result
+
+            urls = await asyncio.to_thread(self._search, user_query)
+
+            # Pages are cleaned and chunked as soon as they are crawled, in
+            # whatever order they finish, while a single consumer embeds them,
+            # so crawl latency overlaps with embedding. With a BM25 prefilter
+            # embedding waits for the crawl, as BM25 needs every page's terms.
+            queue: asyncio.Queue = asyncio.Queue()
+            cleaned: Dict[int, Tuple[NormalizedText, List[str]]] = {}
+            fetched_at: Dict[int, Optional[float]] = {}
+            embedder = None if self._uses_lexical else asyncio.create_task(self._embed_pages(queue, urls, fetched_at))
+            try:
+                with tracer.span("crawl", urls=len(urls)):
+                    async for index, page in self._iter_pages(urls):
+                        if page.markdown:
+                            fetched_at[index] = page.fetched_at
+                            cleaned[index] = await asyncio.to_thread(self._clean_and_chunk, page.markdown)
+                            if embedder is not None:
+                                await queue.put((index, cleaned[index][1]))
+                # Short blocks repeated across pages (site chrome) and copied
+                # chunks are resolved afterwards, in search-result order.
+                dedup = self._new_dedup()
+                page_chunks = await asyncio.to_thread(self._resolve_pages, cleaned, set(), dedup)
+                if embedder is None:
+                    pages = await self._embed_candidates(user_query, page_chunks, urls, fetched_at)
+                else:
+                    await queue.put(None)
+                    pages = await self._reuse_embeddings(page_chunks, await embedder)
+            except BaseException:
+                if embedder is not None:
+                    embedder.cancel()
+                query_emb.cancel()
+                raise
+
+            all_chunks: List[str] = []
+            all_embs = []
+            all_lexical = []
+            for index in sorted(pages):
+                chunks, embs, lexical = pages[index]
+                all_chunks.extend(chunks)
+                all_embs.append(embs)
+                all_lexical.append(lexical)
+            build_span.set(pages=len(pages), chunks=len(all_chunks),
+                           duplicate_chunks=dedup.duplicates if dedup is not None else 0)
+
+            metadata = {"mode": "crawl", "crawled": urls, "skipped": []}
+            if not all_chunks:
+                return ContextResult(self._combine_content([]), metadata)
+            with tracer.span("rank", chunks=len(all_chunks)):
+                scores = self.sim_search.score_embeddings(await query_emb, np.concatenate(all_embs))
+                if self.lexical_weight > 0 and scores.size:
+                    scores = fuse_scores(scores, np.concatenate(all_lexical), self.lexical_weight)
+                indices, top_scores = self.sim_search.select_top_k(scores, top_k)
+            retrieved = [(all_chunks[i], top_scores[j]) for j, i in enumerate(indices)]
+            context = self._combine_content(retrieved)
+            build_span.set(context_chars=len(context))
+            return ContextResult(context, metadata)
+
+    async def _adaptive_context(self, user_query: str, top_k: int, query_emb: asyncio.Task) -> ContextResult:
+        items = await asyncio.to_thread(self._search_results, user_query)
+        urls = [item['link'] for item in items]
+        snippets = [self._snippet_text(item) for item in items]
+        emb = await query_emb
+        snippet_scores = (self.sim_search.score_embeddings(emb, await asyncio.to_thread(self._embed_batch, snippets))
+                          if snippets else np.array([]))
+        if snippet_scores.size == 0:
+            snippet_scores = np.zeros(len(items), dtype=np.float32)
+        order = [int(i) for i in np.argsort(-snippet_scores, kind="stable")]
+        strong = [i for i in order if snippet_scores[i] >= self.snippet_threshold]
+        metadata: Dict[str, Any] = {
+            "snippet_scores": [round(float(score), 4) for score in snippet_scores],
+            "snippet_threshold": self.snippet_threshold,
+            "strong_snippets": len(strong),
+        }
+        snippet_context = [(snippets[i], float(snippet_scores[i])) for i in (strong or order)[:top_k]]
+        if strong and len(strong) >= min(self.snippet_min_hits, top_k):
+            metadata.update(mode="snippets", crawled=[], skipped=urls)
+            return ContextResult(self._combine_content(snippet_context), metadata)
+
+        # Crawl the most promising results first and stop once the
+        # collected chunks already cover top_k strong passages.
+        ranked_urls = [urls[i] for i in order]
+        # Repeats and copies are resolved across waves in rank order.
+        seen: Set[str] = set()
+        dedup = self._new_dedup()
+        all_chunks: List[str] = []
+        all_embs = []
+        # Every chunk crawled so far, embedded or not: the BM25 collection.
+        collected: List[str] = []
+        crawled: List[str] = []
+        strong_chunks = 0
+        with tracer.span("crawl", urls=len(ranked_urls)) as crawl_span:
+            for start in range(0, len(ranked_urls), self.crawl_wave):
+                wave = ranked_urls[start:start + self.crawl_wave]
+                wave_cleaned: Dict[int, Tuple[NormalizedText, List[str]]] = {}
+                wave_fetched_at: Dict[int, Optional[float]] = {}
+                async for index, page in self._iter_pages(wave):
+                    if page.markdown:
+                        wave_fetched_at[index] = page.fetched_at
+                        wave_cleaned[index] = await asyncio.to_thread(self._clean_and_chunk, page.markdown)
+                crawled.extend(wave)
+                wave_chunks = await asyncio.to_thread(self._resolve_pages, wave_cleaned, seen, dedup)
+                for index in sorted(wave_chunks):
+                    collected.extend(wave_chunks[index])
+                pages = await self._embed_candidates(user_query, wave_chunks, wave, wave_fetched_at) if wave_chunks else {}
+                for index in sorted(pages):
+                    chunks, embs, _ = pages[index]
+                    all_chunks.extend(chunks)
+                    all_embs.append(embs)
+                    scores = self.sim_search.score_embeddings(emb, embs)
+                    strong_chunks += int(np.count_nonzero(scores >= self.chunk_threshold))
+                if strong_chunks >= top_k:
+                    break
+            crawl_span.set(crawled=len(crawled), strong_chunks=strong_chunks)
+
+        metadata.update(mode="crawl", crawled=crawled, skipped=ranked_urls[len(crawled):],
+                        chunks=len(all_chunks), strong_chunks=strong_chunks)
+        if not all_chunks:
+            # Every crawl failed or came back empty; the snippets are all there is.
+            metadata["mode"] = "snippets"
+            return ContextResult(self._combine_content(snippet_context), metadata)
+        with tracer.span("rank", chunks=len(all_chunks)):
+            scores = self.sim_search.score_embeddings(emb, np.concatenate(all_embs))
+            if self.lexical_weight > 0 and scores.size:
+                # Each wave chose its candidates with its own term statistics;
+                # the scores that are fused come from one index over every wave.
+                lexical = dict(zip(collected, BM25Index(collected).scores(user_query)))
+                scores = fuse_scores(scores, np.array([lexical[chunk] for chunk in all_chunks], dtype=np.float32),
+                                     self.lexical_weight)
+            indices, top_scores = self.sim_search.select_top_k(scores, top_k)
+        return ContextResult(
+            self._combine_content([(all_chunks[i], top_scores[j]) for j, i in enumerate(indices)]), metadata
+        )
+
+    @staticmethod
+    def _snippet_text(item: Dict[str, Any]) -> str:
+        text = ". ".join(part for part in (item.get('title'), item.get('snippet')) if part)
+        if item.get('date'):
+            text = f"{text} ({item['date']})"
+        # Snippets go into the prompt template as they are, like cleaned pages.
+        return text.replace('{', '{{').replace('}', '}}')
+
+    def build_contexts(self,
+                       user_queries: List[str],
+                       top_k: int = 5) -> List[str]:
+        return run_sync(self.abuild_contexts(user_queries, top_k))
+
+    async def abuild_contexts(self,
+                              user_queries: List[str],
+                              top_k: int = 5) -> List[str]:
+        """Build one context per query, sharing the crawl and embedding work.
+
+        The searches run concurrently, every URL returned for any query is
+        crawled and chunked once, the union of chunks is embedded in one
+        batch, and each query is ranked against the chunks of its own
+        search results. Contexts are returned in input order. In adaptive
+        mode every query is built on its own, concurrently.
+        """
+        if not user_queries:
+            return []
+        with tracer.span("build_contexts", queries=len(user_queries), top_k=top_k) as build_span:
+            if self.adaptive:
+                # Each query decides on its own whether to crawl; pages that
+                # several queries do crawl are shared through the page cache.
+                results = await asyncio.gather(*(self.abuild_context_result(q, top_k) for q in user_queries))
+                return [result.context for result in results]
+            query_embs = asyncio.create_task(asyncio.to_thread(self._embed_queries, user_queries))
+            contexts: List[Optional[str]] = [None] * len(user_queries)
+            if self.knowledge_index is not None:
+                embs = await query_embs
+                for qi in range(len(user_queries)):
+                    local = await asyncio.to_thread(self._search_local, embs[qi:qi + 1], top_k)
+                    if local:
+                        contexts[qi] = self._combine_content(local)
+            pending = [qi for qi, context in enumerate(contexts) if context is None]
+            build_span.set(local=len(user_queries) - len(pending))
+            if not pending:
+                return contexts
+
+            results = await asyncio.gather(*(
+                asyncio.to_thread(self._search, user_queries[qi]) for qi in pending
+            ))
+            query_urls = {qi: urls for qi, urls in zip(pending, results)}
+            unique_urls = list(dict.fromkeys(url for urls in results for url in urls))
+            build_span.set(urls=sum(map(len, results)), unique_urls=len(unique_urls))
+
+            cleaned: Dict[int, Tuple[NormalizedText, List[str]]] = {}
+            fetched_at: Dict[str, Optional[float]] = {}
+            try:
+                with tracer.span("crawl", urls=len(unique_urls)):
+                    async for index, page in self._iter_pages(unique_urls):
+                        if page.markdown:
+                            fetched_at[unique_urls[index]] = page.fetched_at
+                            cleaned[index] = await asyncio.to_thread(self._clean_and_chunk, page.markdown)
+                # Copied chunks are merged into shared columns by _merge_pages below.
+                resolved = await asyncio.to_thread(self._resolve_pages, cleaned, set(), None)
+            except BaseException:
+                query_embs.cancel()
+                raise
+            page_chunks = {unique_urls[index]: chunks for index, chunks in resolved.items()}
+
+            all_chunks, spans, owned = await asyncio.to_thread(self._merge_pages, unique_urls, page_chunks)
+            build_span.set(chunks=len(all_chunks),
+                           duplicate_chunks=sum(map(len, page_chunks.values())) - len(all_chunks))
+
+            # Pages that share a copied chunk share its column; rank it once.
+            query_cols = {qi: list(dict.fromkeys(col for url in query_urls[qi] if url in spans for col in spans[url]))
+                          for qi in pending}
+            lexical: Dict[int, np.ndarray] = {}
+            if self._uses_lexical and all_chunks:
+                query_cols, lexical = await asyncio.to_thread(
+                    self._lexical_columns, {qi: user_queries[qi] for qi in pending}, all_chunks, query_cols
+                )
+            embedded = sorted(set().union(*query_cols.values()))
+            position = {col: row for row, col in enumerate(embedded)}
+            doc_embs = (await asyncio.to_thread(self._embed_batch, [all_chunks[col] for col in embedded])
+                        if embedded else np.array([]))
+            if self.knowledge_index is not None and doc_embs.size:
+                for url, cols in owned.items():
+                    # KnowledgeIndex.add replaces a URL's entry, so a page cut
+                    # down to some query's BM25 candidates is not stored.
+                    if all(col in position for col in cols):
+                        await asyncio.to_thread(self.knowledge_index.add, url, [all_chunks[col] for col in cols],
+                                                doc_embs[[position[col] for col in cols]], fetched_at.get(url))
+
+            embs = await query_embs
+            with tracer.span("rank", queries=len(pending), chunks=len(embedded)):
+                # Without query embeddings every pending query gets the empty context.
+                scores = self.sim_search.score_matrix(embs[pending], doc_embs) if embs.size and doc_embs.size else None
+                for row, qi in enumerate(pending):
+                    cols = query_cols[qi]
+                    if scores is None or not cols:
+                        contexts[qi] = self._combine_content([])
+                        continue
+                    query_scores = scores[row, [position[col] for col in cols]]
+                    if self.lexical_weight > 0:
+                        query_scores = fuse_scores(query_scores, lexical[qi][cols], self.lexical_weight)
+                    indices, top_scores = self.sim_search.select_top_k(query_scores, top_k)
+                    contexts[qi] = self._combine_content(
+                        [(all_chunks[cols[i]], top_scores[j]) for j, i in enumerate(indices)]
+                    )
+            return contexts
+
+    async def _iter_pages(self, urls: List[str]) -> AsyncIterator[Tuple[int, PageResult]]:
+        """Crawl ``urls`` concurrently, yielding ``(index, page)`` as each page finishes."""
+        async for index, page in self.crawler.iter_pages(urls):
+            tracer.record("crawl.page", page.latency * 1000.0, url=page.url,
+                          chars=len(page.markdown or ""), from_cache=page.from_cache,
+                          error=page.error)
+            yield index, page
+
+    def _resolve_pages(self, cleaned: Dict[int, Tuple[NormalizedText, List[str]]], seen: Set[str],
+                       dedup: Optional[NearDuplicateFilter]) -> Dict[int, List[str]]:
+        """Each page's final chunks, resolved in page order whatever order the pages were crawled in.
+
+        A short block that an earlier page (or a page in ``seen``) already
+        showed is dropped and the page is chunked again without it; chunks
+        that copy earlier ones are dropped by ``dedup``. The first page to
+        show something keeps it, so the same results give the same context.
+        """
+        pages: Dict[int, List[str]] = {}
+        with tracer.span("resolve", pages=len(cleaned)) as span:
+            rechunked = 0
+            duplicates = dedup.duplicates if dedup is not None else 0
+            for index in sorted(cleaned):
+                text, chunks = cleaned[index]
+                resolved = self.normalizer.drop_repeats(text, seen)
+                if resolved is not text:
+                    chunks = self.chunker.chunk_text(resolved.text)
+                    rechunked += 1
+                if dedup is not None:
+                    chunks = dedup.filter(chunks)
+                if chunks:
+                    pages[index] = chunks
+            span.set(rechunked=rechunked,
+                     duplicate_chunks=dedup.duplicates - duplicates if dedup is not None else 0)
+        return pages
+
+    def _merge_pages(self, urls: List[str], page_chunks: Dict[str, List[str]]
+                     ) -> Tuple[List[str], Dict[str, List[int]], Dict[str, List[int]]]:
+        """Lay out the chunks of all pages as the columns of one matrix.
+
+        A chunk that copies an earlier one (within or across pages) shares
+        its column instead of getting its own, so it is embedded once.
+        Returns the unique chunks, every page's columns, and the columns
+        each page contributed first.
+        """
+        dedup = self._new_dedup()
+        all_chunks: List[str] = []
+        spans: Dict[str, List[int]] = {}
+        owned: Dict[str, List[int]] = {}
+        for url in urls:
+            chunks = page_chunks.get(url)
+            if not chunks:
+                continue
+            cols = spans[url] = []
+            for chunk in chunks:
+                col, is_new = dedup.add(chunk) if dedup is not None else (len(all_chunks), True)
+                if is_new:
+                    all_chunks.append(chunk)
+                    owned.setdefault(url, []).append(col)
+                cols.append(col)
+        return all_chunks, spans, owned
+
+    def _lexical_columns(self, user_queries: Dict[int, str], chunks: List[str], query_cols: Dict[int, List[int]]
+                         ) -> Tuple[Dict[int, List[int]], Dict[int, np.ndarray]]:
+        """Narrow every query's columns to its BM25 top-N; also returns each query's BM25 scores."""
+        with tracer.span("lexical", chunks=len(chunks), queries=len(user_queries), top_n=self.lexical_top_n) as span:
+            bm25 = BM25Index(chunks)
+            lexical = {qi: bm25.scores(query) for qi, query in user_queries.items()}
+            if self.lexical_top_n is not None:
+                query_cols = {qi: top_n_ids(lexical[qi], self.lexical_top_n, among=cols).tolist()
+                              for qi, cols in query_cols.items()}
+            span.set(candidates=len(set().union(*query_cols.values())))
+        return query_cols, lexical
+
+    def _new_dedup(self) -> Optional[NearDuplicateFilter]:
+        if self.dedup_threshold is None:
+            return None
+        return NearDuplicateFilter(threshold=self.dedup_threshold)
+
+    def _search(self, user_query: str) -> List[str]:
+        return [item['link'] for item in self._search_results(user_query)]
+
+    def _search_results(self, user_query: str) -> List[Dict[str, Any]]:
+        """Organic results (link, title, snippet, date) that have a link, one per URL."""
+        with tracer.span("search.request", query_chars=len(user_query)) as span:
+            result = self.search_api.get_sources(user_query, num_results=3, stored_location="us")
+            organic = result.data.get('organic', []) if result.success else []
+            # A URL listed twice is crawled and ranked once, as in abuild_contexts.
+            items = []
+            seen = set()
             for item in organic:
-                url = item.get('link')
-                if url:
-                    urls.append(url)
+                if item.get('link') and item['link'] not in seen:
+                    seen.add(item['link'])
+                    items.append(item)
+            span.set(success=result.success, results=len(items))
+            return items
+
+    def _embed_queries(self, user_queries: List[str]) -> np.ndarray:
+        with tracer.span("embed.query", texts=len(user_queries), chars=sum(map(len, user_queries))):
+            return self.sim_search.get_embedding(user_queries)
+
+    def _embed_query(self, user_query: str) -> np.ndarray:
+        with tracer.span("embed.query", texts=1, chars=len(user_query)):
+            return self.sim_search.get_embedding([user_query])
+
+    def _search_local(self, query_emb: np.ndarray, top_k: int) -> List[Tuple[str, float]]:
+        """Chunks from the knowledge index, or [] when local recall or freshness is insufficient."""
+        if query_emb.size == 0:
+            return []
+        with tracer.span("index.search", indexed=len(self.knowledge_index)) as span:
+            hits = self.knowledge_index.search(query_emb[0], top_k, max_age=self.local_max_age)
+            good = [(hit.text, hit.score) for hit in hits if hit.score >= self.local_min_score]
+            span.set(hits=len(hits), good_hits=len(good))
+        if len(good) < min(self.local_min_hits, top_k):
+            return []
+        return good
+
+    @property
+    def _uses_lexical(self) -> bool:
+        return self.lexical_top_n is not None or self.lexical_weight > 0
+
+    async def _embed_pages(self, queue: asyncio.Queue, urls: List[str], fetched_at: Dict[int, Optional[float]]
+                           ) -> Dict[int, Tuple[List[str], np.ndarray]]:
+        """Embed pages as they arrive; returns ``index -> (chunks, embeddings)``.
 
-        results = asyncio.run(self.crawler.crawl_urls(urls))
+        ``fetched_at`` holds each page's crawl time, filled in before the page is queued.
+        """
+        pages = {}
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            index, chunks = item
+            if not chunks:
+                continue
+            embs = await asyncio.to_thread(self._embed_batch, chunks)
+            if embs.size:
+                pages[index] = (chunks, embs)
+                if self.knowledge_index is not None:
+                    await asyncio.to_thread(self.knowledge_index.add, urls[index], chunks, embs, fetched_at[index])
+        return pages
 
-        for md in results:
-            if md:
-                docs.append(self._clean_markdown(md))
+    async def _reuse_embeddings(self, page_chunks: Dict[int, List[str]],
+                                embedded: Dict[int, Tuple[List[str], np.ndarray]]
+                                ) -> Dict[int, Tuple[List[str], np.ndarray, Optional[np.ndarray]]]:
+        """Embeddings for each page's resolved chunks, embedding only chunks that resolving changed."""
+        known: Dict[str, np.ndarray] = {}
+        for chunks, embs in embedded.values():
+            known.update(zip(chunks, embs))
+        missing = list(dict.fromkeys(chunk for chunks in page_chunks.values() for chunk in chunks
+                                     if chunk not in known))
+        if missing:
+            embs = await asyncio.to_thread(self._embed_batch, missing)
+            if embs.size:
+                known.update(zip(missing, embs))
+        pages = {}
+        for index, chunks in page_chunks.items():
+            chunks = [chunk for chunk in chunks if chunk in known]
+            if chunks:
+                pages[index] = (chunks, np.stack([known[chunk] for chunk in chunks]), None)
+        return pages
 
-        all_chunks = []
-        for doc in docs:
-            chunks = self.chunker.chunk_text(doc)
-            all_chunks.extend(chunks)
+    async def _embed_candidates(self, user_query: str, page_chunks: Dict[int, List[str]], urls: List[str],
+                                fetched_at: Dict[int, Optional[float]]) -> Dict[int, Tuple[List[str], np.ndarray, Optional[np.ndarray]]]:
+        """Embed the pages' chunks in one batch, keeping only BM25 candidates when enabled."""
+        if self._uses_lexical:
+            candidates = await asyncio.to_thread(self._lexical_candidates, user_query, page_chunks)
+        else:
+            candidates = {index: (chunks, None) for index, chunks in page_chunks.items()}
+        flat = [chunk for chunks, _ in candidates.values() for chunk in chunks]
+        embs = await asyncio.to_thread(self._embed_batch, flat) if flat else np.array([])
+        pages = {}
+        if not embs.size:
+            return pages
+        start = 0
+        for index, (chunks, lexical) in candidates.items():
+            page_embs = embs[start:start + len(chunks)]
+            start += len(chunks)
+            pages[index] = (chunks, page_embs, lexical)
+            # KnowledgeIndex.add replaces a URL's entry, and later lookups
+            # take it for the whole page, so prefiltered pages are not stored.
+            if self.knowledge_index is not None and len(chunks) == len(page_chunks[index]):
+                await asyncio.to_thread(self.knowledge_index.add, urls[index], chunks, page_embs, fetched_at[index])
+        return pages
 
-        retrieved = self.sim_search.get_retrieved_documents(user_query, all_chunks, top_k)
-        return self._combine_content(retrieved)
+    def _lexical_candidates(self, user_query: str, page_chunks: Dict[int, List[str]]
+                            ) -> Dict[int, Tuple[List[str], np.ndarray]]:
+        """Each page's chunks among the query's BM25 top-N, with their BM25 scores."""
+        owners = [index for index, chunks in page_chunks.items() for _ in chunks]
+        chunks = [chunk for page in page_chunks.values() for chunk in page]
+        with tracer.span("lexical", chunks=len(chunks), top_n=self.lexical_top_n) as span:
+            lexical = BM25Index(chunks).scores(user_query)
+            keep = top_n_ids(lexical, self.lexical_top_n if self.lexical_top_n is not None else len(chunks))
+            span.set(candidates=len(keep))
+        candidates: Dict[int, Tuple[List[str], List[float]]] = {}
+        for i in keep:
+            page, scores = candidates.setdefault(owners[i], ([], []))
+            page.append(chunks[i])
+            scores.append(lexical[i])
+        return {index: (page, np.array(scores, dtype=np.float32)) for index, (page, scores) in candidates.items()}
 
-    def _clean_markdown(self, md: str) -> str:
-        md = md.replace('{', '{{').replace('}', '}}') 
-        text = re.sub(r'```.*?```', '', md, flags=re.S)
-        text = re.sub(r"\[([^\]]+)\]\([^\)]+\)", r"\1", text)
-        text = re.sub(r'[#>*\-_`]', '', text)
-        return re.sub(r'\s+', ' ', text).strip()
+    def _embed_batch(self, chunks: List[str]) -> np.ndarray:
+        with tracer.span("embed.batch", texts=len(chunks), chars=sum(map(len, chunks))) as span:
+            embs = self.sim_search.embed_documents(chunks)
+            span.set(cache_hits=self.sim_search.last_cache_stats["hits"],
+                     cache_misses=self.sim_search.last_cache_stats["misses"])
+            return embs
 
+    def _clean_and_chunk(self, md: str) -> Tuple[NormalizedText, List[str]]:
+        with tracer.span("chunk", input_chars=len(md)) as span:
+            cleaned = self.normalizer.normalize(md)
+            chunks = self.chunker.chunk_text(cleaned.text)
+            # Every character removed here is one the embedding model never sees.
+            span.set(chunks=len(chunks), removed_chars=cleaned.removed_chars,
+                     boilerplate_chars=cleaned.boilerplate_chars)
+            return cleaned, chunks
 
     def _combine_content(self, results: list[tuple[str, float]]):
         if not results:
@@ -1,21 +1,78 @@
 import asyncio
-from typing import List, Optional
+import atexit
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
 from crawl4ai import (AsyncWebCrawler, BrowserConfig, CacheMode,
                       CrawlerRunConfig)
 
+from .page_cache import PageCache
+
+
+@dataclass
+class PageResult:
+    url: str
+    markdown: Optional[str] = None
+    error: Optional[str] = None
+    latency: float = 0.0
+    from_cache: bool = False
+    # Unix time the page was crawled; for a cache hit, when it was first crawled.
+    fetched_at: Optional[float] = None
+
+    @property
+    def success(self) -> bool:
+        return self.markdown is not None
+
 
 class MultiURLCrawler:
+    """Crawls pages on a long-lived pool of browsers.
+
+    The browsers live on a private event loop thread, so they survive
+    across ``asyncio.run`` calls and can be shared by every request in
+    the process. At most ``max_concurrent_pages`` pages are rendered at
+    once and each one is bounded by ``page_timeout`` seconds; a failing
+    page yields a failed ``PageResult`` instead of aborting the batch.
+    """
+
     def __init__(
         self,
         headless: bool = True, 
         cache_mode: CacheMode = CacheMode.BYPASS,
         run_timeout: Optional[int] = None,
+        page_cache: Optional[PageCache] = None,
+        pool_size: int = 1,
+        max_concurrent_pages: int = 8,
+        page_timeout: Optional[float] = 60.0,
     ):
+        self.page_cache = page_cache
         self.browser_conf = BrowserConfig(headless=headless)
         self.run_conf = CrawlerRunConfig(cache_mode=cache_mode)
         if run_timeout is not None:
             self.run_conf.run_timeout = run_timeout
+        self.pool_size = max(1, pool_size)
+        self.max_concurrent_pages = max(1, max_concurrent_pages)
+        self.page_timeout = page_timeout
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._thread_lock = threading.Lock()
+        self._crawlers: List[AsyncWebCrawler] = []
+        self._start_lock: Optional[asyncio.Lock] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._next_crawler = 0
+
+        self._in_flight = 0
+        self._peak_in_flight = 0
+        self._pages = 0
+        self._failures = 0
+        self._timeouts = 0
+        self._cache_hits = 0
+        self._busy_time = 0.0
+        self._started_at: Optional[float] = None
+        self._latencies: deque = deque(maxlen=1000)
 
     async def _fetch(self, crawler: AsyncWebCrawler, url: str) -> Optional[str]:
         result = await crawler.arun(url=url, config=self.run_conf)
@@ -23,14 +80,135 @@ class MultiURLCrawler:
             return result.markdown.raw_markdown
         return None
 
+    def _pool_loop(self) -> asyncio.AbstractEventLoop:
+        with self._thread_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name="crawler-pool", daemon=True)
+                thread.start()
+                self._loop, self._thread = loop, thread
+                atexit.register(self.close)
+            return self._loop
+
+    async def _ensure_started(self) -> None:
+        if self._start_lock is None:
+            self._start_lock = asyncio.Lock()
+            self._semaphore = asyncio.Semaphore(self.max_concurrent_pages)
+        async with self._start_lock:
+            while len(self._crawlers) < self.pool_size:
+                crawler = AsyncWebCrawler(config=self.browser_conf)
+                await crawler.start()
+                self._crawlers.append(crawler)
+            if self._started_at is None:
+                self._started_at = time.monotonic()
+
+    async def _pool_fetch(self, url: str) -> PageResult:
+        # Runs on the pool loop.
+        await self._ensure_started()
+        async with self._semaphore:
+            crawler = self._crawlers[self._next_crawler % len(self._crawlers)]
+            self._next_crawler += 1
+            self._in_flight += 1
+            self._peak_in_flight = max(self._peak_in_flight, self._in_flight)
+            start = time.monotonic()
+            result = PageResult(url=url)
+            try:
+                if self.page_timeout:
+                    result.markdown = await asyncio.wait_for(self._fetch(crawler, url), self.page_timeout)
+                else:
+                    result.markdown = await self._fetch(crawler, url)
+                if result.markdown is None:
+                    result.error = "Crawl failed"
+                else:
+                    result.fetched_at = time.time()
+            except asyncio.TimeoutError:
+                self._timeouts += 1
+                result.error = f"Timed out after {self.page_timeout}s"
+            except Exception as e:
+                result.error = f"Crawl error: {e}"
+            finally:
+                self._in_flight -= 1
+                result.latency = time.monotonic() - start
+                self._busy_time += result.latency
+                self._latencies.append(result.latency)
+                self._pages += 1
+                if result.error:
+                    self._failures += 1
+            return result
+
+    async def fetch_page(self, url: str) -> PageResult:
+        # The page cache is SQLite; keep its disk I/O off the caller's event loop.
+        cached = await asyncio.to_thread(self.page_cache.get, url) if self.page_cache else None
+        if cached is not None:
+            self._cache_hits += 1
+            return PageResult(url=url, markdown=cached.markdown, from_cache=True, fetched_at=cached.fetched_at)
+
+        future = asyncio.run_coroutine_threadsafe(self._pool_fetch(url), self._pool_loop())
+        result = await asyncio.wrap_future(future)
+        if result.markdown and self.page_cache:
+            await asyncio.to_thread(self.page_cache.put, url, result.markdown)
+        return result
+
+    async def _fetch_indexed(self, index: int, url: str) -> Tuple[int, PageResult]:
+        return index, await self.fetch_page(url)
+
+    async def iter_pages(self, urls: List[str]) -> AsyncIterator[Tuple[int, PageResult]]:
+        """Yield ``(index, PageResult)`` pairs as soon as each page is available."""
+        tasks = [asyncio.ensure_future(self._fetch_indexed(i, url)) for i, url in enumerate(urls)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def crawl_pages(self, urls: List[str]) -> List[PageResult]:
+        return list(await asyncio.gather(*(self.fetch_page(url) for url in urls)))
+
     async def crawl_urls(self, urls: List[str]) -> List[Optional[str]]:
-        async with AsyncWebCrawler(config=self.browser_conf) as crawler:
-            return await asyncio.gather(
-                *(self._fetch(crawler, url) for url in urls),
-                return_exceptions=False
-            )
+        return [page.markdown for page in await self.crawl_pages(urls)]
+
+    def stats(self) -> Dict[str, Any]:
+        latencies = sorted(self._latencies)
+        uptime = time.monotonic() - self._started_at if self._started_at else 0.0
+        capacity = uptime * self.max_concurrent_pages
+        return {
+            "pool_size": len(self._crawlers),
+            "max_concurrent_pages": self.max_concurrent_pages,
+            "in_flight": self._in_flight,
+            "peak_in_flight": self._peak_in_flight,
+            "utilization": self._busy_time / capacity if capacity else 0.0,
+            "pages": self._pages,
+            "failures": self._failures,
+            "timeouts": self._timeouts,
+            "cache_hits": self._cache_hits,
+            "latency_p50": latencies[len(latencies) // 2] if latencies else None,
+            "latency_p95": latencies[int(len(latencies) * 0.95)] if latencies else None,
+        }
+
+    async def _close_crawlers(self) -> None:
+        crawlers, self._crawlers = self._crawlers, []
+        for crawler in crawlers:
+            try:
+                await crawler.close()
+            except Exception as e:
+                print(f"Error closing crawler: {e}")
+
+    def close(self) -> None:
+        with self._thread_lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+        if loop is None:
+            return
+        atexit.unregister(self.close)
+        asyncio.run_coroutine_threadsafe(self._close_crawlers(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+        self._start_lock = self._semaphore = None
 
 if __name__ == "__main__":
+    # Run as a module from search_agent/: python -m context_scraping.scrape
 
     test_urls = ["https://www.worldometers.info/world-population/japan-population/"]
     crawler = MultiURLCrawler(headless=True, cache_mode=CacheMode.BYPASS)
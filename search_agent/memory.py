@@ -0,0 +1,119 @@
+from typing import Callable, Dict, List, Optional, Tuple
+
+TokenCounter = Callable[[str], int]
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (about four characters per token)."""
+    return (len(text) + 3) // 4
+
+
+def truncate_middle(text: str, max_tokens: int, count_tokens: TokenCounter = estimate_tokens) -> str:
+    """Keep the start and end of ``text`` and elide the middle to fit ``max_tokens``."""
+    total = count_tokens(text)
+    if total <= max_tokens:
+        return text
+    if max_tokens <= 0:
+        return f"[{total} tokens elided]"
+    # Characters per token of this text, so the cut lands close to the budget.
+    keep_chars = max(1, int(len(text) * max_tokens / total))
+    head = text[:keep_chars * 2 // 3].rstrip()
+    tail = text[len(text) - keep_chars // 3:].lstrip() if keep_chars // 3 else ""
+    elided = total - count_tokens(head) - count_tokens(tail)
+    return f"{head}\n... [{elided} tokens elided] ...\n{tail}".rstrip()
+
+
+def fit_to_budget(texts: List[str],
+                  budget: Optional[int],
+                  keep_recent: int = 2,
+                  min_tokens: int = 64,
+                  count_tokens: TokenCounter = estimate_tokens) -> List[str]:
+    """Shrink older ``texts`` until all of them fit in ``budget`` tokens.
+
+    The last ``keep_recent`` texts are never touched. Older ones are cut
+    down, oldest first, to ``min_tokens`` each and then dropped to a short
+    placeholder if that is still not enough.
+    """
+    if budget is None:
+        return list(texts)
+    fitted = list(texts)
+    sizes = [count_tokens(text) for text in fitted]
+    older = range(max(0, len(fitted) - keep_recent))
+    for floor in (min_tokens, 0):
+        for i in older:
+            excess = sum(sizes) - budget
+            if excess <= 0:
+                return fitted
+            if sizes[i] <= floor:
+                continue
+            target = max(floor, sizes[i] - excess)
+            fitted[i] = truncate_middle(texts[i], target, count_tokens) if target else "[elided]"
+            sizes[i] = count_tokens(fitted[i])
+    return fitted
+
+
+class ConversationMemory:
+    """Chat history that is re-rendered within a token budget on every call.
+
+    Ordinary messages are always sent verbatim. Tool observations are kept
+    verbatim for the ``keep_recent`` most recent ones, while older ones
+    are shrunk with ``fit_to_budget`` so the whole history fits in
+    ``token_budget``. Tokens are counted with ``count_tokens`` (e.g. the
+    model's tokenizer) or a fast estimate. When the model reports the
+    prompt tokens it actually received, ``record_usage`` rescales the
+    estimate to match.
+    """
+
+    def __init__(self,
+                 token_budget: Optional[int] = 6000,
+                 keep_recent: int = 2,
+                 min_tokens: int = 64,
+                 count_tokens: Optional[TokenCounter] = None):
+        self.token_budget = token_budget
+        self.keep_recent = keep_recent
+        self.min_tokens = min_tokens
+        self._count = count_tokens or estimate_tokens
+        self._scale = 1.0
+        # (role, text, observations, suffix). Plain messages have no observations
+        # and are sent verbatim; for observation messages ``text`` is the separator
+        # between the (label, text) pairs, which are shrunk to fit the budget.
+        self._entries: List[Tuple[str, str, List[Tuple[str, str]], str]] = []
+        self.last_token_count = 0
+
+    def count_tokens(self, text: str) -> int:
+        return int(round(self._count(text) * self._scale))
+
+    def add(self, role: str, content: str) -> None:
+        self._entries.append((role, content, [], ""))
+
+    def add_observation(self, observation: str, prefix: str = "Observation: ",
+                        suffix: str = "", role: str = "user") -> None:
+        self.add_observations([(prefix, observation)], suffix=suffix, role=role)
+
+    def add_observations(self, observations: List[Tuple[str, str]], suffix: str = "",
+                         role: str = "user", separator: str = "\n") -> None:
+        """Add several labelled observations as one message; each is budgeted on its own."""
+        self._entries.append((role, separator, list(observations), suffix))
+
+    def messages(self) -> List[Dict[str, str]]:
+        fixed = sum(self.count_tokens(text) if not observations else
+                    self.count_tokens("".join(label for label, _ in observations) + suffix)
+                    for _, text, observations, suffix in self._entries)
+        bodies = [body for _, _, observations, _ in self._entries for _, body in observations]
+        budget = None if self.token_budget is None else max(0, self.token_budget - fixed)
+        fitted = iter(fit_to_budget(bodies, budget, keep_recent=self.keep_recent,
+                                    min_tokens=self.min_tokens, count_tokens=self.count_tokens))
+        messages = []
+        for role, text, observations, suffix in self._entries:
+            if observations:
+                text = text.join(label + next(fitted) for label, _ in observations) + suffix
+            messages.append({"role": role, "content": text})
+        self.last_token_count = sum(self.count_tokens(m["content"]) for m in messages)
+        return messages
+
+    def record_usage(self, input_tokens: Optional[int]) -> None:
+        """Calibrate the token estimate against the count the model reported for the last ``messages()``."""
+        if not input_tokens or not self.last_token_count:
+            return
+        observed = input_tokens / (self.last_token_count / self._scale)
+        self._scale = 0.5 * self._scale + 0.5 * observed
@@ -1,13 +1,17 @@
 import os
 from .react_prompt import react_system_prompt
 from .calculate_tools import CalculateTool
-from .search_tool import OpenDeepSearchTool
+from . import registry
+from .memory import ConversationMemory, estimate_tokens, fit_to_budget
+from .streaming import (AgentEvent, FINAL_ANSWER, OBSERVATION, THOUGHT, TOKEN, TOOL_END,
+                        TOOL_START, TOOL_TOKEN, iter_in_context)
+from .tracing import token_usage, tracer
 
 from langchain.schema import AgentAction, AgentFinish
-from langchain_ollama import ChatOllama
-from langchain.prompts import ChatPromptTemplate
-from typing import Dict, List, Optional, Tuple, Union
+from typing import Callable, Dict, Generator, Iterator, List, Optional, Tuple
 import re
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import dotenv
 
@@ -15,31 +19,71 @@ api_key = os.getenv('SERPER_API_KEY')
 dotenv.load_dotenv()
 
 
+_THOUGHT_PATTERN = re.compile(r"Thought:(.*?)(?:Action(?:\s+\d+)?\s*:|$)", re.DOTALL)
+# "Action: tool / Action Input: ..." or numbered "Action 1: ... / Action Input 1: ..." blocks.
+_ACTION_PATTERN = re.compile(
+    r"Action(?:\s+\d+)?\s*:(.*?)(?:Action Input(?:\s+\d+)?\s*:(.*?))?"
+    r"(?=Action(?:\s+\d+)?\s*:|Observation(?:\s+\d+)?\s*:|$)",
+    re.DOTALL,
+)
+# Anything from the first observation on was invented by the model, not returned by a tool.
+_OBSERVATION_LINE = re.compile(r"^\s*Observation(?:\s+\d+)?\s*:", re.MULTILINE)
+
+
 class ReActAgent:
-    def __init__(self, model_name="qwen2.5:14b-instruct-q8_0", temperature=0.3):
-        self.llm = ChatOllama(model=model_name, temperature=temperature)
+    def __init__(self, model_name="qwen2.5:14b-instruct-q8_0", temperature=0.3, verbose: bool = True,
+                 token_budget: Optional[int] = 6000, keep_recent_observations: int = 2,
+                 count_tokens: Optional[Callable[[str], int]] = None,
+                 max_parallel_tools: int = 4):
+        self.model_name = model_name
+        self.llm = registry.get_chat_ollama(model_name, temperature)
         self.system_prompt = react_system_prompt
+        self.verbose = verbose
+        self.token_budget = token_budget
+        self.keep_recent_observations = keep_recent_observations
+        self.count_tokens = count_tokens
+        self.max_parallel_tools = max_parallel_tools
+
+    def _log(self, message: str) -> None:
+        if self.verbose:
+            print(message)
+
+    def _invoke_llm(self, messages: List[Dict[str, str]], estimated_tokens: Optional[int] = None):
+        with tracer.span("llm.call", model=self.model_name, messages=len(messages),
+                         input_chars=sum(len(m["content"]) for m in messages),
+                         estimated_input_tokens=estimated_tokens) as span:
+            response = self.llm.invoke(messages)
+            span.set(output_chars=len(response.content), **token_usage(response))
+            return response
             
-    def _parse_response(self, response: str) -> Tuple[str, Optional[AgentAction], Optional[AgentFinish]]:
-        thought_match = re.search(r"Thought:(.*?)(?:Action:|$)", response, re.DOTALL)
-        action_match = re.search(r"Action:(.*?)(?:Action Input:|$)", response, re.DOTALL)
-        action_input_match = re.search(r"Action Input:(.*?)(?:Observation:|$)", response, re.DOTALL)
-        
+    def _parse_response(self, response: str) -> Tuple[str, List[AgentAction], Optional[AgentFinish]]:
+        observation = _OBSERVATION_LINE.search(response)
+        if observation:
+            response = response[:observation.start()]
+        thought_match = _THOUGHT_PATTERN.search(response)
         thought = thought_match.group(1).strip() if thought_match else ""
-        action = action_match.group(1).strip() if action_match else None
-        action_input = action_input_match.group(1).strip() if action_input_match else None
+        actions = [
+            AgentAction(tool=match.group(1).strip(),
+                        tool_input=(match.group(2) or "").strip(),
+                        log=thought)
+            for match in _ACTION_PATTERN.finditer(response)
+            if match.group(1).strip()
+        ]
         
-        print(f"DEBUG - Parsed components: Thought found: {bool(thought)}, Action: '{action}', Action Input exists: {bool(action_input)}")
+        self._log(f"DEBUG - Parsed components: Thought found: {bool(thought)}, "
+                  f"Actions: {[action.tool for action in actions]}, "
+                  f"Action Inputs exist: {[bool(action.tool_input) for action in actions]}")
         
-        if action == "Finish":
-            return thought, None, AgentFinish(return_values={"output": action_input}, log=thought)
-        elif action:
-            return thought, AgentAction(tool=action, tool_input=action_input, log=thought), None
+        if actions and actions[0].tool == "Finish":
+            return thought, [], AgentFinish(return_values={"output": actions[0].tool_input}, log=thought)
+        actions = [action for action in actions if action.tool != "Finish"]
+        if actions:
+            return thought, actions, None
         else:
             if thought and "final answer" in thought.lower():
-                print("DEBUG - Detected final answer intent in thought")
-                return thought, None, AgentFinish(return_values={"output": thought}, log=thought)
-            return thought, None, None
+                self._log("DEBUG - Detected final answer intent in thought")
+                return thought, [], AgentFinish(return_values={"output": thought}, log=thought)
+            return thought, [], None
             
     def _format_intermediate_steps(self, intermediate_steps: List[Tuple[AgentAction, str]]) -> str:
         formatted_steps = ""
@@ -50,65 +94,178 @@ class ReActAgent:
             formatted_steps += "Thought: "
         return formatted_steps
     
+    def _call_llm(self, messages: List[Dict[str, str]], stream: bool,
+                  memory: Optional[ConversationMemory] = None) -> Generator[AgentEvent, None, str]:
+        """LLM reply text; when streaming, yields a token event per delta first."""
+        estimated = memory.last_token_count if memory else None
+        if not stream:
+            response = self._invoke_llm(messages, estimated)
+        else:
+            with tracer.span("llm.call", model=self.model_name, messages=len(messages), stream=True,
+                             input_chars=sum(len(m["content"]) for m in messages),
+                             estimated_input_tokens=estimated) as span:
+                response = None
+                for chunk in self.llm.stream(messages):
+                    response = chunk if response is None else response + chunk
+                    if chunk.content:
+                        yield AgentEvent(TOKEN, chunk.content)
+                if response is None:
+                    return ""
+                span.set(output_chars=len(response.content), **token_usage(response))
+        usage = token_usage(response)
+        if memory is not None:
+            memory.record_usage(usage.get("input_tokens"))
+        if usage.get("input_tokens"):
+            self._log(f"Prompt tokens reported by the model: {usage['input_tokens']}")
+        return response.content
+
     def execute_tool(self, tool_name: str, tool_input: str) -> str:
         tool_name = tool_name.strip()
-        if tool_name == "calculate":
-            return CalculateTool.execute(tool_input)
-        elif tool_name == "web_search":
-            return OpenDeepSearchTool(serper_api_key=api_key).run(tool_input)
-        else:
-            return f"Unknown tool: {tool_name}"
-    
+        with tracer.span("tool.execute", tool=tool_name, input_chars=len(tool_input or "")) as span:
+            if tool_name == "calculate":
+                observation = CalculateTool.execute(tool_input)
+            elif tool_name == "web_search":
+                observation = registry.get_search_tool(serper_api_key=api_key).run(tool_input)
+            else:
+                observation = f"Unknown tool: {tool_name}"
+            span.set(output_chars=len(observation))
+            return observation
+
+    def _execute_tool_stream(self, tool_name: str, tool_input: str) -> Generator[AgentEvent, None, str]:
+        tool_name = tool_name.strip()
+        if tool_name != "web_search":
+            return self.execute_tool(tool_name, tool_input)
+        with tracer.span("tool.execute", tool=tool_name, input_chars=len(tool_input or ""), stream=True) as span:
+            parts = []
+            for piece in registry.get_search_tool(serper_api_key=api_key).run_stream(tool_input):
+                parts.append(piece)
+                yield AgentEvent(TOOL_TOKEN, piece, {"tool": tool_name})
+            observation = "".join(parts)
+            span.set(output_chars=len(observation))
+            return observation
+
+    def _execute_parallel(self, actions: List[AgentAction], iteration: int) -> Generator[AgentEvent, None, List[str]]:
+        """Run independent actions concurrently; observations come back in action order."""
+        # Identical calls in one turn are executed once.
+        unique = list(dict.fromkeys((action.tool.strip(), action.tool_input) for action in actions))
+        results: Dict[Tuple[str, str], str] = {}
+        for index, action in enumerate(actions, start=1):
+            self._log(f"[Iter {iteration}] Executing tool {index}: {action.tool}")
+            self._log(f"Action Input {index}: {action.tool_input}")
+            yield AgentEvent(TOOL_START, action.tool_input or "",
+                             {"tool": action.tool, "iteration": iteration, "index": index})
+        with ThreadPoolExecutor(max_workers=min(self.max_parallel_tools, len(unique))) as executor:
+            futures = {
+                executor.submit(contextvars.copy_context().run, self.execute_tool, tool, tool_input): (tool, tool_input)
+                for tool, tool_input in unique
+            }
+            for future in as_completed(futures):
+                key = futures[future]
+                try:
+                    results[key] = future.result()
+                except Exception as e:
+                    results[key] = f"Error running {key[0]}: {e}"
+                for index, action in enumerate(actions, start=1):
+                    if (action.tool.strip(), action.tool_input) == key:
+                        yield AgentEvent(TOOL_END, "", {"tool": action.tool, "iteration": iteration, "index": index})
+                        self._log(f"Observation {index}: {results[key]}")
+                        yield AgentEvent(OBSERVATION, results[key],
+                                         {"tool": action.tool, "iteration": iteration, "index": index})
+        return [results[(action.tool.strip(), action.tool_input)] for action in actions]
+
     def run(self, user_question: str, max_iterations: int = 5) -> str:
-        messages = [
-            {"role": "system", "content": self.system_prompt},
-            {"role": "user",   "content": (
-                f"Answer the question using ReAct.\n"
-                f"Question: {user_question}\n"
-                f"Begin with a Thought:"
-            )}
-        ]
+        with tracer.trace("react.run", model=self.model_name, question_chars=len(user_question)):
+            answer = None
+            for event in self._steps(user_question, max_iterations, stream=False):
+                if event.type == FINAL_ANSWER:
+                    answer = event.content
+            return answer
+
+    def run_stream(self, user_question: str, max_iterations: int = 5) -> Iterator[AgentEvent]:
+        """Like ``run``, but yields AgentEvents as the run progresses."""
+        return iter_in_context(self._traced_stream(user_question, max_iterations))
+
+    def _traced_stream(self, user_question: str, max_iterations: int) -> Iterator[AgentEvent]:
+        with tracer.trace("react.run", model=self.model_name, question_chars=len(user_question), stream=True):
+            yield from self._steps(user_question, max_iterations, stream=True)
+
+    def _steps(self, user_question: str, max_iterations: int, stream: bool) -> Iterator[AgentEvent]:
+        memory = ConversationMemory(self.token_budget, keep_recent=self.keep_recent_observations,
+                                    count_tokens=self.count_tokens)
+        memory.add("system", self.system_prompt)
+        memory.add("user", (
+            f"Answer the question using ReAct.\n"
+            f"Question: {user_question}\n"
+            f"Begin with a Thought:"
+        ))
 
         action_history = []
 
         for iteration in range(1, max_iterations + 1):
-            response = self.llm.invoke(messages)
-            content = response.content.strip()
-            thought, action, final = self._parse_response(content)
+            messages = memory.messages()
+            self._log(f"[Iter {iteration}] Sending {len(messages)} messages, ~{memory.last_token_count} tokens")
+            content = (yield from self._call_llm(messages, stream, memory)).strip()
+            thought, actions, final = self._parse_response(content)
 
-            print(f"[Iter {iteration}] Thought: {thought}")
+            self._log(f"[Iter {iteration}] Thought: {thought}")
+            if thought:
+                yield AgentEvent(THOUGHT, thought, {"iteration": iteration, "input_tokens": memory.last_token_count})
 
             if final:
                 answer = final.return_values.get("output", "")
-                print(f"Final answer obtained in {iteration} iterations.")
-                return answer
+                self._log(f"Final answer obtained in {iteration} iterations.")
+                yield AgentEvent(FINAL_ANSWER, answer, {"iterations": iteration})
+                return
 
-            if not action:
-                print(f"No action parsed at iteration {iteration}. Stopping.")
+            if not actions:
+                self._log(f"No action parsed at iteration {iteration}. Stopping.")
                 break
 
-            print(f"[Iter {iteration}] Executing tool: {action.tool}")
-            print(f"Action Input: {action.tool_input}")
-            observation = self.execute_tool(action.tool, action.tool_input)
-            print(f"Observation: {observation}")
-            
-            action_history.append((action.tool, action.tool_input, observation))
+            if len(actions) == 1:
+                action = actions[0]
+                self._log(f"[Iter {iteration}] Executing tool: {action.tool}")
+                self._log(f"Action Input: {action.tool_input}")
+                yield AgentEvent(TOOL_START, action.tool_input or "", {"tool": action.tool, "iteration": iteration})
+                if stream:
+                    observation = yield from self._execute_tool_stream(action.tool, action.tool_input)
+                else:
+                    observation = self.execute_tool(action.tool, action.tool_input)
+                yield AgentEvent(TOOL_END, "", {"tool": action.tool, "iteration": iteration})
+                self._log(f"Observation: {observation}")
+                yield AgentEvent(OBSERVATION, observation, {"tool": action.tool, "iteration": iteration})
+                observations = [observation]
+            else:
+                observations = yield from self._execute_parallel(actions, iteration)
+
+            for action, observation in zip(actions, observations):
+                action_history.append((action.tool, action.tool_input, observation))
 
-            messages.append({"role": "assistant", "content": content})
-            messages.append({"role": "user", "content": f"Observation: {observation}\nThought:"})
+            memory.add("assistant", content)
+            if len(actions) == 1:
+                memory.add_observation(observations[0], suffix="\nThought:")
+            else:
+                memory.add_observations([(f"Observation {i}: ", observation)
+                                         for i, observation in enumerate(observations, start=1)],
+                                        suffix="\nThought:")
 
-        print("Max iterations reached without a final answer.")
+        self._log("Max iterations reached without a final answer.")
  
         if action_history:
-            return self._synthesize_from_history(user_question, action_history, thought)
-        return content
+            answer = yield from self._synthesize_from_history(user_question, action_history, thought, stream)
+        else:
+            answer = content
+        yield AgentEvent(FINAL_ANSWER, answer, {"iterations": iteration})
     
     def _synthesize_from_history(self, original_question: str,
                                action_history: List[Tuple[str, str, str]], 
-                               last_thought: str) -> str:
+                               last_thought: str,
+                               stream: bool = False) -> Generator[AgentEvent, None, Optional[str]]:
+        observations = fit_to_budget([observation for _, _, observation in action_history],
+                                     self.token_budget, keep_recent=self.keep_recent_observations,
+                                     count_tokens=self.count_tokens or estimate_tokens)
         action_summary = "\n".join([
             f"- Used {action} tool with input '{tool_input}' and got: {observation}"
-            for action, tool_input, observation in action_history
+            for (action, tool_input, _), observation in zip(action_history, observations)
         ])
         
         prompt = f"""Based on the original question and the information gathered from tools,
@@ -127,12 +284,10 @@ class ReActAgent:
         ]
         
         try:
-            response = self.llm.invoke(messages)
-            final_answer = response.content.strip()
+            final_answer = (yield from self._call_llm(messages, stream)).strip()
             return final_answer
         except Exception as e:
-            print(f"Error synthesizing from history: {e}")
-
+            self._log(f"Error synthesizing from history: {e}")
 
 
 if __name__ == "__main__":
@@ -27,9 +27,10 @@ Follow these rules in every response:
     2. Use the correct tool names and literal argument values. Never pass variable names as arguments.
     3. Call a tool only when it is necessary for the current reasoning step; do not invoke tools unnecessarily.
     4. If no tool call is needed to produce the final answer, use the action "Finish" with the complete answer.
-    5. Always format your responses exactly as shown above, with "Thought:", "Action:", "Action Input:", and (after receiving it) "Observation:". Never skip steps or combine them. Always wait for an observation after each action before proceeding.
+    5. Always format your responses exactly as shown above, with "Thought:", "Action:", "Action Input:", and (after receiving it) "Observation:". Never skip steps. Always wait for the observations before proceeding.
     6. Based on previous observations to answer the question or action next step
     7. Always keep the correct input format for tools when calling them like examples below.
+    8. When several tool calls do not depend on each other's results, request them together in one step using numbered "Action N:" / "Action Input N:" blocks. They run at the same time and you receive "Observation N:" for each. Never number an action whose input depends on another action in the same step.
 You have access to the following tools:
 
 {_generate_tools_section()}
@@ -40,6 +41,15 @@ Action: <the tool to use>
 Action Input: <the input to the tool>
 Observation: <the result of the action - will be provided to you>
 
+For independent tool calls in the same step, use numbered blocks instead:
+Thought: <your reasoning>
+Action 1: <the first tool>
+Action Input 1: <the input to the first tool>
+Action 2: <the second tool>
+Action Input 2: <the input to the second tool>
+Observation 1: <the result of the first action - will be provided to you>
+Observation 2: <the result of the second action - will be provided to you>
+
 Start by analyzing the problem. For each step, reason about what information you need and which tool to use.
 
 After receiving an observation, start again with "Thought:" to analyze what you've learned and what to do next.
@@ -96,15 +106,13 @@ Action Input: "The historical event closest in time to the invention of the tele
 -----------------
 Question: Which country has won more total Olympic gold medals: the United States or China?
 
-Thought: I need to find out how many Olympic gold medals the United States has won.
-Action: web_search
-Action Input: "total Olympic gold medals won by the United States"
-Observation: The United States has won 1,127 gold medals.
-
-Thought: Now I need to find out how many Olympic gold medals China has won.
-Action: web_search
-Action Input: "total Olympic gold medals won by China"
-Observation: China has won 283 gold medals.
+Thought: I need the total Olympic gold medals of both countries. The two lookups are independent, so I will do them together.
+Action 1: web_search
+Action Input 1: "total Olympic gold medals won by the United States"
+Action 2: web_search
+Action Input 2: "total Olympic gold medals won by China"
+Observation 1: The United States has won 1,127 gold medals.
+Observation 2: China has won 283 gold medals.
 
 Thought: I will now calculate the difference between the two medal counts.
 Action: calculate
@@ -0,0 +1,158 @@
+import os
+import threading
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional
+
+from langchain_ollama import ChatOllama
+from search_agent.context_building.process_build_context import ProcessBuildContext
+# Importable once process_build_context has put the search_agent directory on sys.path.
+from context_scraping.page_cache import PageCache
+from context_scraping.scrape import MultiURLCrawler
+from search.serper_search import SearchAPI, create_search_api
+from similarity_model.embedding_backends import EmbeddingBackendConfig, load_embedding_model
+from similarity_model.embedding_cache import EmbeddingCache, default_cache_path
+from similarity_model.embedding_service import EmbeddingService
+from similarity_model.knowledge_index import KnowledgeIndex, default_index_path
+from similarity_model.similarity_search import SimilaritySearch
+
+DEFAULT_EMBED_MODEL = 'jinaai/jina-embeddings-v3'
+
+_instances: Dict[Hashable, Any] = {}
+_locks: Dict[Hashable, threading.Lock] = {}
+_registry_lock = threading.Lock()
+
+
+def _get_or_create(key: Hashable, factory: Callable[[], Any]) -> Any:
+    instance = _instances.get(key)
+    if instance is not None:
+        return instance
+    with _registry_lock:
+        lock = _locks.setdefault(key, threading.Lock())
+    with lock:
+        instance = _instances.get(key)
+        if instance is None:
+            instance = factory()
+            _instances[key] = instance
+    return instance
+
+
+def get_embedding_service(model_name: str = DEFAULT_EMBED_MODEL,
+                          backend: Optional[EmbeddingBackendConfig] = None) -> EmbeddingService:
+    """One model per process whose encode calls from all requests are batched together."""
+    backend = backend or EmbeddingBackendConfig.from_env()
+    return _get_or_create(
+        ("embedding_service", model_name, backend),
+        lambda: EmbeddingService(
+            load_embedding_model(model_name, backend),
+            max_batch_size=int(os.getenv("EMBED_MAX_BATCH", "64")),
+            max_wait=float(os.getenv("EMBED_MAX_WAIT_MS", "5")) / 1000.0,
+        ),
+    )
+
+
+def get_similarity_search(model_name: str = DEFAULT_EMBED_MODEL,
+                          use_cache: bool = True,
+                          backend: Optional[EmbeddingBackendConfig] = None,
+                          batching: bool = True) -> SimilaritySearch:
+    backend = backend or EmbeddingBackendConfig.from_env()
+    return _get_or_create(
+        ("similarity_search", model_name, use_cache, backend, batching),
+        lambda: SimilaritySearch(
+            model_name=model_name,
+            embedding_cache=EmbeddingCache(default_cache_path(backend.model_id(model_name))) if use_cache else None,
+            model=get_embedding_service(model_name, backend) if batching else None,
+            backend=backend,
+        ),
+    )
+
+
+def get_crawler(use_cache: bool = True) -> MultiURLCrawler:
+    return _get_or_create(
+        ("crawler", use_cache),
+        lambda: MultiURLCrawler(page_cache=PageCache() if use_cache else None),
+    )
+
+
+def get_search_api(serper_api_key: Optional[str] = None, cache_ttl: Optional[float] = 300.0) -> SearchAPI:
+    serper_api_key = serper_api_key or os.getenv('SERPER_API_KEY')
+    return _get_or_create(
+        ("search_api", serper_api_key, cache_ttl),
+        lambda: create_search_api(serper_api_key, cache_ttl=cache_ttl),
+    )
+
+
+def get_chat_ollama(model: str, temperature: float = 0.3) -> ChatOllama:
+    return _get_or_create(
+        ("chat_ollama", model, temperature),
+        lambda: ChatOllama(model=model, temperature=temperature),
+    )
+
+
+def get_genai_client(api_key: Optional[str] = None):
+    from google import genai
+
+    api_key = api_key or os.getenv("GEMINI_API_KEY")
+    return _get_or_create(("genai_client", api_key), lambda: genai.Client(api_key=api_key))
+
+
+def get_knowledge_index(model_name: str = DEFAULT_EMBED_MODEL,
+                        backend: Optional[EmbeddingBackendConfig] = None) -> KnowledgeIndex:
+    model_id = (backend or EmbeddingBackendConfig.from_env()).model_id(model_name)
+    return _get_or_create(("knowledge_index", model_id),
+                          lambda: KnowledgeIndex(default_index_path(model_id)))
+
+
+def get_build_context(chunk_size: int = 1000,
+                      overlap_sentences: int = 4,
+                      embed_model_name: str = DEFAULT_EMBED_MODEL,
+                      serper_api_key: Optional[str] = None,
+                      use_knowledge_index: bool = False,
+                      lexical_top_n: Optional[int] = None,
+                      lexical_weight: float = 0.0,
+                      adaptive: bool = False,
+                      embedding_backend: Optional[EmbeddingBackendConfig] = None) -> ProcessBuildContext:
+    return ProcessBuildContext(
+        chunk_size=chunk_size,
+        overlap_sentences=overlap_sentences,
+        embed_model_name=embed_model_name,
+        sim_search=get_similarity_search(embed_model_name, backend=embedding_backend),
+        search_api=get_search_api(serper_api_key),
+        crawler=get_crawler(),
+        knowledge_index=get_knowledge_index(embed_model_name, embedding_backend) if use_knowledge_index else None,
+        lexical_top_n=lexical_top_n,
+        lexical_weight=lexical_weight,
+        adaptive=adaptive,
+    )
+
+
+def get_search_tool(**kwargs):
+    from search_agent.search_tool import OpenDeepSearchTool
+
+    key = ("search_tool",) + tuple(sorted(kwargs.items()))
+    return _get_or_create(key, lambda: OpenDeepSearchTool(**kwargs))
+
+
+def get_sandbox_pool(size: Optional[int] = None):
+    """Sandbox workers shared by every CodeAct run; one per agent worker thread by default."""
+    from search_agent.codeact_agent import tools
+    from search_agent.sandbox import SandboxPool
+
+    size = size or int(os.getenv("AGENT_WORKERS", "4"))
+    return _get_or_create(("sandbox_pool", size), lambda: SandboxPool(tools, size=size))
+
+
+def warm_up(embed_model_names: Iterable[str] = (DEFAULT_EMBED_MODEL,),
+            ollama_models: Iterable[str] = (),
+            serper_api_key: Optional[str] = None) -> None:
+    """Load the heavy shared components up front instead of on the first request."""
+    for model_name in embed_model_names:
+        get_similarity_search(model_name)
+    for model in ollama_models:
+        get_chat_ollama(model)
+    get_crawler()
+    get_search_api(serper_api_key)
+
+
+def clear() -> None:
+    with _registry_lock:
+        _instances.clear()
+        _locks.clear()
@@ -0,0 +1,359 @@
+import multiprocessing
+import os
+import pickle
+import resource
+import sys
+import threading
+import time
+import traceback
+import types
+from contextlib import contextmanager, redirect_stdout
+from dataclasses import dataclass
+from io import StringIO
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Tuple
+
+
+@dataclass
+class ExecutionResult:
+    success: bool
+    output: Optional[str] = None
+    error: Optional[str] = None
+    timed_out: bool = False
+
+
+class SandboxError(Exception):
+    """Raised when a sandbox worker cannot be started or dies unexpectedly."""
+
+
+class _ToolProxy:
+    """Stands in for a parent-process tool inside a worker.
+
+    Attribute access builds up a path (``search_tool.run``) and calling it
+    asks the parent to perform the call on the real object.
+    """
+
+    def __init__(self, conn, name: str, path: Tuple[str, ...] = ()):
+        self._conn = conn
+        self._name = name
+        self._path = path
+
+    def __getattr__(self, attr: str) -> "_ToolProxy":
+        if attr.startswith("__"):
+            raise AttributeError(attr)
+        return _ToolProxy(self._conn, self._name, self._path + (attr,))
+
+    def __call__(self, *args, **kwargs):
+        self._conn.send(("call", self._name, self._path, args, kwargs))
+        kind, value = self._conn.recv()
+        if kind == "raise":
+            raise value
+        return value
+
+    def __repr__(self) -> str:
+        return f"<tool {'.'.join((self._name,) + self._path)}>"
+
+
+def _install_class_shims(proxies: Dict[str, _ToolProxy], classes: Dict[str, Tuple[str, str]]) -> None:
+    # Code written as ``from search_tool import OpenDeepSearchTool; OpenDeepSearchTool(...)``
+    # gets the parent's instance instead of building a second pipeline in the worker.
+    for name, (module_name, class_name) in classes.items():
+        proxy = proxies[name]
+        for alias in {module_name, module_name.rsplit(".", 1)[-1]}:
+            shim = types.ModuleType(alias)
+            setattr(shim, class_name, lambda *args, _proxy=proxy, **kwargs: _proxy)
+            sys.modules[alias] = shim
+
+
+def _limit_memory(limit_bytes: Optional[int]) -> None:
+    if not limit_bytes:
+        return
+    try:
+        with open("/proc/self/statm") as f:
+            current = int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        current = 0
+    # The cap is on growth beyond the warmed-up interpreter, whose address
+    # space already includes every library the tools imported.
+    resource.setrlimit(resource.RLIMIT_AS, (current + limit_bytes, resource.RLIM_INFINITY))
+
+
+def _worker_main(conn, local_tools: Dict[str, Any], proxied: List[str],
+                 classes: Dict[str, Tuple[str, str]], memory_limit: Optional[int]) -> None:
+    proxies = {name: _ToolProxy(conn, name) for name in proxied}
+    _install_class_shims(proxies, classes)
+    initial = dict(local_tools, **proxies)
+    namespace = dict(initial)
+    _limit_memory(memory_limit)
+    conn.send(("ready", os.getpid()))
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            return
+        if message[0] == "reset":
+            namespace = dict(initial)
+            conn.send(("reset", None))
+        elif message[0] == "exec":
+            buffer = StringIO()
+            with redirect_stdout(buffer):
+                try:
+                    exec(compile(message[1], "<cell>", "exec"), namespace)
+                except BaseException:
+                    traceback.print_exc(file=buffer)
+            conn.send(("result", buffer.getvalue()))
+        elif message[0] == "stop":
+            return
+
+
+class _Worker:
+    def __init__(self, ctx, local_tools, proxied, classes, memory_limit):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(
+            target=_worker_main,
+            args=(child_conn, local_tools, proxied, classes, memory_limit),
+            daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+
+    def wait_ready(self, timeout: float) -> None:
+        if not self.conn.poll(timeout):
+            self.kill()
+            raise SandboxError("Sandbox worker did not start in time")
+        try:
+            self.conn.recv()
+        except EOFError:
+            raise SandboxError(f"Sandbox worker exited with code {self.process.exitcode}")
+
+    def kill(self) -> None:
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join(1.0)
+        self.conn.close()
+
+
+class Sandbox:
+    """One leased worker; its namespace persists until the lease ends."""
+
+    def __init__(self, pool: "SandboxPool", worker: _Worker):
+        self._pool = pool
+        # None while a worker that could not be restarted awaits its respawn.
+        self._worker: Optional[_Worker] = worker
+        self._released = False
+
+    def execute(self, code: str, timeout: Optional[float] = None) -> ExecutionResult:
+        if self._released:
+            raise SandboxError("Sandbox has been released")
+        return self._pool._execute(self, code, timeout or self._pool.timeout)
+
+
+class SandboxPool:
+    """Pool of pre-started worker processes that execute agent code.
+
+    Workers are started ahead of time from a clean forkserver process, so
+    a run does not pay for interpreter start-up and the parent's threads
+    are never forked. A run leases one worker through ``session()``;
+    variables it defines persist across the steps of that run and are
+    cleared when the lease ends. Every execution has a wall-clock
+    timeout and the worker's address space is capped at
+    ``memory_limit_mb`` above its warmed-up size. A worker that times out
+    or dies is killed and replaced; if the replacement cannot start, an
+    empty slot goes back to the pool and is filled on its next lease.
+    ``session()`` waits at most ``acquire_timeout`` seconds for a free
+    worker and then raises ``SandboxError``.
+
+    The forkserver imports this module (and with it the ``search_agent``
+    package) once, before it forks any worker, so a new worker does not
+    import it again to unpickle its entry point or the tools.
+
+    Plain functions among ``tools`` are sent to the workers and run
+    there. Other tools (e.g. the search tool, which owns the crawler and
+    the embedding model) stay in the parent, and the workers call them
+    through proxies. Time spent in a proxied call does not count against
+    the execution timeout.
+    """
+
+    def __init__(self,
+                 tools: Mapping[str, Any],
+                 size: int = 2,
+                 timeout: float = 60.0,
+                 memory_limit_mb: Optional[int] = 1024,
+                 start_timeout: float = 120.0,
+                 acquire_timeout: Optional[float] = 300.0,
+                 start_method: Optional[str] = None):
+        self.tools = dict(tools)
+        self.size = size
+        self.timeout = timeout
+        self.acquire_timeout = acquire_timeout
+        self.memory_limit = memory_limit_mb * 1024 * 1024 if memory_limit_mb else None
+        self.start_timeout = start_timeout
+        if start_method is None:
+            start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        self._ctx = multiprocessing.get_context(start_method)
+        if start_method == "forkserver":
+            self._ctx.set_forkserver_preload(["__main__", __name__])
+        self._local_tools, self._proxied, self._classes = self._split_tools(self.tools)
+        # None marks a slot whose worker died and could not be restarted yet.
+        self._idle: List[Optional[_Worker]] = []
+        self._cond = threading.Condition()
+        self._closed = False
+        self.restarts = 0
+        workers = [self._spawn() for _ in range(size)]
+        for worker in workers:
+            worker.wait_ready(self.start_timeout)
+        self._idle.extend(workers)
+
+    @staticmethod
+    def _split_tools(tools: Dict[str, Any]):
+        local, proxied, classes = {}, [], {}
+        for name, tool in tools.items():
+            if isinstance(tool, types.FunctionType):
+                try:
+                    pickle.dumps(tool)
+                    local[name] = tool
+                    continue
+                except Exception:
+                    pass
+            proxied.append(name)
+            if not isinstance(tool, types.FunctionType):
+                cls = type(tool)
+                classes[name] = (cls.__module__, cls.__name__)
+        return local, proxied, classes
+
+    def _spawn(self) -> _Worker:
+        return _Worker(self._ctx, self._local_tools, self._proxied, self._classes, self.memory_limit)
+
+    def _replace(self, worker: _Worker) -> Optional[_Worker]:
+        """Kill ``worker`` and start another; None if the new one fails to start."""
+        worker.kill()
+        self.restarts += 1
+        try:
+            return self._start()
+        except (OSError, SandboxError):
+            return None
+
+    def _start(self) -> _Worker:
+        replacement = self._spawn()
+        replacement.wait_ready(self.start_timeout)
+        return replacement
+
+    def _reset(self, worker: Optional[_Worker]) -> Optional[_Worker]:
+        if worker is None:
+            return None
+        try:
+            worker.conn.send(("reset",))
+            if not worker.conn.poll(self.timeout):
+                raise SandboxError("Sandbox worker did not reset")
+            worker.conn.recv()
+            return worker
+        except (OSError, EOFError, SandboxError):
+            return self._replace(worker)
+
+    def _acquire(self) -> Optional[_Worker]:
+        deadline = None if self.acquire_timeout is None else time.monotonic() + self.acquire_timeout
+        with self._cond:
+            while not self._idle:
+                if self._closed:
+                    raise SandboxError("Sandbox pool is closed")
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise SandboxError(f"No sandbox worker became free within {self.acquire_timeout:g}s")
+                self._cond.wait(remaining)
+            return self._idle.pop()
+
+    def _release(self, worker: Optional[_Worker]) -> None:
+        with self._cond:
+            if self._closed:
+                if worker is not None:
+                    worker.kill()
+            else:
+                self._idle.append(worker)
+                self._cond.notify()
+
+    @contextmanager
+    def session(self) -> Iterator[Sandbox]:
+        worker = self._acquire()
+        if worker is None or not worker.process.is_alive():
+            try:
+                if worker is not None:
+                    worker.kill()
+                    self.restarts += 1
+                worker = self._start()
+            except BaseException:
+                # Keep the slot so the pool never shrinks; the next lease retries.
+                self._release(None)
+                raise
+        sandbox = Sandbox(self, worker)
+        try:
+            yield sandbox
+        finally:
+            worker, sandbox._worker = sandbox._worker, None
+            sandbox._released = True
+            try:
+                worker = self._reset(worker)
+            finally:
+                self._release(worker)
+
+    def _execute(self, sandbox: Sandbox, code: str, timeout: float) -> ExecutionResult:
+        if sandbox._worker is None:
+            try:
+                sandbox._worker = self._start()
+            except (OSError, SandboxError) as e:
+                return ExecutionResult(success=False, error=f"Sandbox worker could not be restarted: {e}")
+        worker = sandbox._worker
+        try:
+            worker.conn.send(("exec", code))
+            deadline = time.monotonic() + timeout
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not worker.conn.poll(remaining):
+                    sandbox._worker = self._replace(worker)
+                    return ExecutionResult(
+                        success=False, timed_out=True,
+                        error=f"Execution timed out after {timeout:.0f}s; the sandbox was reset and its variables were lost",
+                    )
+                message = worker.conn.recv()
+                if message[0] == "result":
+                    return ExecutionResult(success=True, output=message[1])
+                if message[0] == "call":
+                    called = time.monotonic()
+                    worker.conn.send(self._call_tool(*message[1:]))
+                    # The worker is idle while the parent runs the tool.
+                    deadline += time.monotonic() - called
+        except (OSError, EOFError):
+            worker.process.join(1.0)
+            exitcode = worker.process.exitcode
+            sandbox._worker = self._replace(worker)
+            return ExecutionResult(
+                success=False,
+                error=f"Sandbox worker exited (code {exitcode}); the sandbox was reset and its variables were lost",
+            )
+
+    def _call_tool(self, name: str, path: Tuple[str, ...], args, kwargs) -> Tuple[str, Any]:
+        try:
+            target = self.tools[name]
+            for attr in path:
+                target = getattr(target, attr)
+            value = target(*args, **kwargs)
+            pickle.dumps(value)
+            return "return", value
+        except Exception as e:
+            try:
+                pickle.dumps(e)
+                return "raise", e
+            except Exception:
+                return "raise", RuntimeError(f"{type(e).__name__}: {e}")
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            workers, self._idle = self._idle, []
+            self._cond.notify_all()
+        for worker in workers:
+            if worker is None:
+                continue
+            try:
+                worker.conn.send(("stop",))
+            except OSError:
+                pass
+            worker.kill()
@@ -1,6 +1,11 @@
+import copy
 import os
-from dataclasses import dataclass
-from typing import Dict, Any, Optional, List, TypeVar, Generic
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass, field, replace
+from typing import Dict, Any, Optional, List, Tuple, TypeVar, Generic
 from abc import ABC, abstractmethod
 import requests
 
@@ -14,7 +19,7 @@ class SerperAPIException(SearchAPIException):
 @dataclass
 class SerperConfig:
     api_key: str
-    api_url: str = "https://google.serper.dev/search"
+    api_url: str = field(default_factory=lambda: os.getenv("SERPER_API_URL", "https://google.serper.dev/search"))
     default_location: str = 'us'
     timeout: int = 10
 
@@ -36,6 +41,9 @@ class SearchResult(Generic[T]):
     def failed(self) -> bool:
         return not self.success
 
+    def copy(self) -> 'SearchResult[T]':
+        return SearchResult(data=copy.deepcopy(self.data), error=self.error)
+
 class SearchAPI(ABC):
     @abstractmethod
     def get_sources(
@@ -49,7 +57,9 @@ class SearchAPI(ABC):
 class SerperAPI(SearchAPI):
 
     def __init__(self, api_key: Optional[str] = None, config: Optional[SerperConfig] = None):
-        if api_key:
+        if api_key and config:
+            self.config = replace(config, api_key=api_key)
+        elif api_key:
             self.config = SerperConfig(api_key=api_key)
         else:
             self.config = config or SerperConfig.from_env()
@@ -104,7 +114,86 @@ class SerperAPI(SearchAPI):
             return SearchResult(error=f"Unexpected error: {e}")
 
 
+class CachedSearchAPI(SearchAPI):
+    """TTL cache with single-flight request coalescing in front of a SearchAPI.
+
+    Only successful results are cached. Concurrent calls with the same
+    normalized (query, num, gl) key wait for the one upstream request
+    that is already in flight instead of issuing their own. Every caller
+    gets its own copy of the result, so callers cannot change each
+    other's (or the cache's) data.
+    """
+
+    def __init__(self, search_api: SearchAPI, ttl: float = 300.0, max_entries: int = 1024):
+        self.search_api = search_api
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._cache: "OrderedDict[Tuple[str, int, str], Tuple[float, SearchResult]]" = OrderedDict()
+        self._inflight: Dict[Tuple[str, int, str], Future] = {}
+        self._lock = threading.Lock()
+
+    def cache_key(self, query: str, num_results: int, stored_location: Optional[str]) -> Tuple[str, int, str]:
+        config = getattr(self.search_api, 'config', None)
+        location = stored_location or getattr(config, 'default_location', '')
+        return (" ".join(query.lower().split()), min(max(1, num_results), 10), location.lower())
+
+    def get_sources(
+        self,
+        query: str,
+        num_results: int = 8,
+        stored_location: Optional[str] = None
+    ) -> SearchResult[Dict[str, Any]]:
+        if not query.strip():
+            return SearchResult(error="Query cannot be empty")
+
+        key = self.cache_key(query, num_results, stored_location)
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None and time.monotonic() - entry[0] <= self.ttl:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return entry[1].copy()
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            return future.result().copy()
+
+        try:
+            result = self.search_api.get_sources(query, num_results=num_results, stored_location=stored_location)
+        except Exception as e:
+            result = SearchResult(error=f"Unexpected error: {e}")
+
+        with self._lock:
+            if result.success:
+                self._cache[key] = (time.monotonic(), result.copy())
+                self._cache.move_to_end(key)
+                while len(self._cache) > self.max_entries:
+                    self._cache.popitem(last=False)
+            del self._inflight[key]
+        future.set_result(result)
+        return result.copy()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+
 def create_search_api(
     serper_api_key: Optional[str] = None,
+    cache_ttl: Optional[float] = 300.0,
 ) -> SearchAPI:
-    return SerperAPI(api_key=serper_api_key)
+    search_api = SerperAPI(api_key=serper_api_key)
+    if cache_ttl:
+        return CachedSearchAPI(search_api, ttl=cache_ttl)
+    return search_api
+
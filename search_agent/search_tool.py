@@ -1,12 +1,25 @@
+import asyncio
 import os
+from dataclasses import dataclass
+from typing import Iterator, List
 
 import dotenv
-from search_agent.context_building.process_build_context import ProcessBuildContext
+from search_agent.context_building.process_build_context import ProcessBuildContext, run_sync
+from search_agent import registry
+from search_agent.streaming import iter_in_context
+from search_agent.tracing import token_usage, tracer
 from langchain.prompts import ChatPromptTemplate
-from langchain_ollama import ChatOllama
 
 dotenv.load_dotenv()
 
+
+@dataclass
+class BatchAnswer:
+    query: str
+    answer: str
+    context: str
+
+
 class OpenDeepSearchTool:
     name = "web_search"
     description = """Performs web search based on your query,
@@ -26,43 +39,123 @@ class OpenDeepSearchTool:
                  serper_api_key: str = None,
                  top_k: int = 5,
                  llm_model: str = "openchat:7b-v3.5-1210-q4_K_M",
-                 temperature: float = 0.3):
-        self.builder = ProcessBuildContext(
-            chunk_size=chunk_size,
-            overlap_sentences=overlap_sentences,
-            embed_model_name=embed_model_name,
-            serper_api_key=serper_api_key
-        )
+                 temperature: float = 0.3,
+                 use_knowledge_index: bool = False,
+                 lexical_top_n: int = None,
+                 lexical_weight: float = 0.0,
+                 adaptive: bool = False,
+                 builder: ProcessBuildContext = None):
+        self.chunk_size = chunk_size
+        self.overlap_sentences = overlap_sentences
+        self.embed_model_name = embed_model_name
+        self.serper_api_key = serper_api_key
         self.top_k = top_k
         self.llm_model = llm_model
         self.temperature = temperature
+        self.use_knowledge_index = use_knowledge_index
+        self.lexical_top_n = lexical_top_n
+        self.lexical_weight = lexical_weight
+        self.adaptive = adaptive
+        self._builder = builder
+
+    @property
+    def builder(self) -> ProcessBuildContext:
+        if self._builder is None:
+            self._builder = registry.get_build_context(
+                chunk_size=self.chunk_size,
+                overlap_sentences=self.overlap_sentences,
+                embed_model_name=self.embed_model_name,
+                serper_api_key=self.serper_api_key,
+                use_knowledge_index=self.use_knowledge_index,
+                lexical_top_n=self.lexical_top_n,
+                lexical_weight=self.lexical_weight,
+                adaptive=self.adaptive,
+            )
+        return self._builder
 
     def run(self, query: str) -> str:
+        with tracer.span("search_tool.run", query_chars=len(query)):
+            try:
+                context = self.builder.build_context(query, top_k=self.top_k)
+            except Exception as e:
+                return f"Error during context building: {e}"
+            return self.answer(query, context)
 
-        try:
-            context = self.builder.build_context(query, top_k=self.top_k)
-        except Exception as e:
-            return f"Error during context building: {e}"
-        return self.answer(query, context)
+    async def arun(self, query: str) -> str:
+        with tracer.span("search_tool.run", query_chars=len(query)):
+            try:
+                context = await self.builder.abuild_context(query, top_k=self.top_k)
+            except Exception as e:
+                return f"Error during context building: {e}"
+            return await asyncio.to_thread(self.answer, query, context)
+
+    def run_batch(self, queries: List[str]) -> List[BatchAnswer]:
+        """Answer several queries, crawling and embedding their shared sources once."""
+        return run_sync(self.arun_batch(queries))
+
+    async def arun_batch(self, queries: List[str]) -> List[BatchAnswer]:
+        with tracer.span("search_tool.run_batch", queries=len(queries)):
+            try:
+                contexts = await self.builder.abuild_contexts(queries, top_k=self.top_k)
+            except Exception as e:
+                error = f"Error during context building: {e}"
+                return [BatchAnswer(query=query, answer=error, context="") for query in queries]
+            answers = await asyncio.gather(*(
+                asyncio.to_thread(self.answer, query, context) for query, context in zip(queries, contexts)
+            ))
+            return [BatchAnswer(query=query, answer=answer, context=context)
+                    for query, answer, context in zip(queries, answers, contexts)]
+
+    def run_stream(self, query: str) -> Iterator[str]:
+        """Like ``run``, but yields the answer in pieces as the LLM produces them."""
+        return iter_in_context(self._run_stream(query))
+
+    def _run_stream(self, query: str) -> Iterator[str]:
+        with tracer.span("search_tool.run", query_chars=len(query), stream=True):
+            try:
+                context = self.builder.build_context(query, top_k=self.top_k)
+            except Exception as e:
+                yield f"Error during context building: {e}"
+                return
+            yield from self.answer_stream(query, context)
+
+    def _answer_chain(self, user_question: str, context: str):
+        chat_ollama = registry.get_chat_ollama(self.llm_model, self.temperature)
+        search_answer_prompt = """You are an AI-powered search agent that takes in a user`s search query, retrieves relevant search results, and provides an accurate and concise answer based on the provided context"""
+        prompt = ChatPromptTemplate.from_messages([
+            ("system", search_answer_prompt),
+            ("system", "Information:\n"+ str(context)),
+            ("human", user_question)
+        ])
+        input_chars = len(search_answer_prompt) + len(str(context)) + len(user_question)
+        return prompt | chat_ollama, input_chars
 
     def answer(self, user_question: str, context: str) -> str:
         try:
-            chat_ollama = ChatOllama(model=self.llm_model, temperature=self.temperature)
-            search_answer_prompt = """You are an AI-powered search agent that takes in a user`s search query, retrieves relevant search results, and provides an accurate and concise answer based on the provided context"""
-            prompt = ChatPromptTemplate.from_messages([
-                ("system", search_answer_prompt),
-                ("system", "Information:\n"+ str(context)),
-                ("human", user_question)
-            ])
+            chain, input_chars = self._answer_chain(user_question, context)
             prompt_values = {}
-
-            chain = prompt | chat_ollama
-            response = chain.invoke(prompt_values)
+            with tracer.span("llm.call", model=self.llm_model, input_chars=input_chars) as span:
+                response = chain.invoke(prompt_values)
+                span.set(output_chars=len(response.content), **token_usage(response))
             return response.content
 
         except Exception as e:
             return f"Error during answer generation: {e}"
 
+    def answer_stream(self, user_question: str, context: str) -> Iterator[str]:
+        try:
+            chain, input_chars = self._answer_chain(user_question, context)
+            with tracer.span("llm.call", model=self.llm_model, input_chars=input_chars, stream=True) as span:
+                response = None
+                for chunk in chain.stream({}):
+                    response = chunk if response is None else response + chunk
+                    if chunk.content:
+                        yield chunk.content
+                if response is not None:
+                    span.set(output_chars=len(response.content), **token_usage(response))
+
+        except Exception as e:
+            yield f"Error during answer generation: {e}"
 
 if __name__ == '__main__':
     api_key = os.getenv('SERPER_API_KEY')
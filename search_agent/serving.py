@@ -0,0 +1,219 @@
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, Iterator, Optional
+
+from .streaming import AgentEvent, FINAL_ANSWER
+
+
+class ServerBusy(Exception):
+    """Raised when the request queue is full."""
+
+
+@dataclass
+class _Request:
+    agent_name: str
+    message: str
+    submitted: float
+    events: "queue.Queue" = field(default_factory=queue.Queue)
+    # Set when the consumer stops reading the stream.
+    cancelled: threading.Event = field(default_factory=threading.Event)
+
+
+@dataclass
+class _Session:
+    agents: Dict[str, Any] = field(default_factory=dict)
+    last_used: float = field(default_factory=time.monotonic)
+    # Requests waiting for the one before them in this session to finish.
+    pending: Deque[_Request] = field(default_factory=deque)
+    running: bool = False
+
+
+_DONE = object()
+
+
+class AgentServer:
+    """Runs agent requests for many chat sessions on a bounded worker pool.
+
+    Every session gets its own agent instances, created lazily by
+    ``agent_factories``, so conversation and REPL state never leak between
+    users. The agents take their LLM clients and search tool from
+    ``registry``, so the heavy models are still loaded once per process.
+    At most ``max_workers`` requests run at a time and at most
+    ``max_queue`` more wait for a worker; beyond that ``stream`` raises
+    ServerBusy. Requests from the same session run one at a time, in
+    order: a request for a busy session waits in that session's queue and
+    is handed to the pool only when the session's previous request has
+    finished, so it never holds a worker while it waits. A request whose
+    consumer stops reading its stream is cancelled; the agent's run is
+    closed at its next event.
+    """
+
+    def __init__(self,
+                 agent_factories: Dict[str, Callable[[], Any]],
+                 max_workers: int = 4,
+                 max_queue: int = 16,
+                 max_sessions: int = 256,
+                 session_ttl: float = 1800.0):
+        self.agent_factories = agent_factories
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.max_sessions = max_sessions
+        self.session_ttl = session_ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="agent-worker")
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._active = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._started_at = time.monotonic()
+        self._queue_waits: Deque[float] = deque(maxlen=1000)
+        self._latencies: Deque[float] = deque(maxlen=1000)
+        self._finished_at: Deque[float] = deque(maxlen=1000)
+
+    def _session(self, session_id: str) -> _Session:
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.pop(session_id, None) or _Session()
+            session.last_used = now
+            self._sessions[session_id] = session
+            while self._sessions:
+                oldest_id, oldest = next(iter(self._sessions.items()))
+                expired = now - oldest.last_used > self.session_ttl
+                if oldest_id == session_id or not (expired or len(self._sessions) > self.max_sessions):
+                    break
+                del self._sessions[oldest_id]
+            return session
+
+    def _agent(self, session: _Session, agent_name: str) -> Any:
+        agent = session.agents.get(agent_name)
+        if agent is None:
+            agent = self.agent_factories[agent_name]()
+            session.agents[agent_name] = agent
+        return agent
+
+    def stream(self, session_id: str, agent_name: str, message: str) -> Iterator[AgentEvent]:
+        """Queue a request and yield its events as a worker produces them."""
+        if agent_name not in self.agent_factories:
+            raise KeyError(f"Unknown agent: {agent_name}")
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise ServerBusy(f"{self.max_workers + self.max_queue} requests already queued or running")
+
+        request = _Request(agent_name, message, time.monotonic())
+        session = self._session(session_id)
+        with self._lock:
+            self._queued += 1
+            session.pending.append(request)
+            start = not session.running
+            session.running = True
+        if start:
+            try:
+                self._executor.submit(self._work, session)
+            except BaseException:
+                with self._lock:
+                    self._queued -= 1
+                    session.pending.remove(request)
+                    session.running = False
+                self._slots.release()
+                raise
+        return self._drain(request)
+
+    @staticmethod
+    def _drain(request: _Request) -> Iterator[AgentEvent]:
+        try:
+            while True:
+                item = request.events.get()
+                if item is _DONE:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            request.cancelled.set()
+
+    def run(self, session_id: str, agent_name: str, message: str) -> Optional[str]:
+        answer = None
+        for event in self.stream(session_id, agent_name, message):
+            if event.type == FINAL_ANSWER:
+                answer = event.content
+        return answer
+
+    def _work(self, session: _Session) -> None:
+        """Run the session's oldest pending request, then requeue the session if more are waiting."""
+        with self._lock:
+            request = session.pending.popleft()
+            started = time.monotonic()
+            self._queued -= 1
+            self._active += 1
+            self._queue_waits.append(started - request.submitted)
+        failed = False
+        try:
+            if not request.cancelled.is_set():
+                run = self._agent(session, request.agent_name).run_stream(request.message)
+                try:
+                    for event in run:
+                        if request.cancelled.is_set():
+                            break
+                        request.events.put(event)
+                finally:
+                    close = getattr(run, "close", None)
+                    if close is not None:
+                        close()
+        except Exception as e:
+            failed = True
+            request.events.put(e)
+        finally:
+            finished = time.monotonic()
+            with self._lock:
+                self._active -= 1
+                self._latencies.append(finished - started)
+                self._finished_at.append(finished)
+                if failed:
+                    self._failed += 1
+                else:
+                    self._completed += 1
+                more = bool(session.pending)
+                session.running = more
+            request.events.put(_DONE)
+            self._slots.release()
+            if more:
+                # Back of the pool's queue, so one busy session cannot starve the others.
+                self._executor.submit(self._work, session)
+
+    def stats(self, window: float = 60.0) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            waits = sorted(self._queue_waits)
+            latencies = sorted(self._latencies)
+            recent = sum(1 for t in self._finished_at if now - t <= window)
+            span = min(window, now - self._started_at)
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "sessions": len(self._sessions),
+                "queued": self._queued,
+                "active": self._active,
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "throughput_per_s": recent / span if span > 0 else 0.0,
+                "queue_wait_p50": _percentile(waits, 0.5),
+                "queue_wait_p95": _percentile(waits, 0.95),
+                "latency_p50": _percentile(latencies, 0.5),
+                "latency_p95": _percentile(latencies, 0.95),
+            }
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
+
+
+def _percentile(values, q: float) -> Optional[float]:
+    return values[min(int(len(values) * q), len(values) - 1)] if values else None
@@ -1,5 +1,16 @@
 import re
-from typing import List
+from typing import Iterator, List, NamedTuple, Tuple
+
+_PARAGRAPH_BREAK = re.compile(r'\n{2,}')
+_SENTENCE_BREAK = re.compile(r'(?<=[.!?])\s+')
+_TERMINATED = re.compile(r'[.!?]\s*$')
+
+
+class Chunk(NamedTuple):
+    start: int
+    end: int
+    text: str
+
 
 class TextChunker:
     def __init__(self, max_chunk_size: int = 2500, overlap_sentences: int = 10):
@@ -15,41 +26,79 @@ class TextChunker:
             sentences = sentences[:-1] + [sentences[-1] + '.']
         return sentences
 
-    def chunk_text(self, text: str) -> List[str]:
+    def _iter_paragraph_spans(self, text: str) -> Iterator[Tuple[int, int]]:
+        lo = len(text) - len(text.lstrip())
+        hi = len(text.rstrip())
+        if lo >= hi:
+            return
+        pos = lo
+        for match in _PARAGRAPH_BREAK.finditer(text, lo, hi):
+            yield pos, match.start()
+            pos = match.end()
+        yield pos, hi
+
+    def _iter_sentences(self, text: str, start: int, end: int, block: str) -> Iterator[Tuple[int, int, str]]:
+        lo = start + len(block) - len(block.lstrip())
+        hi = start + len(block.rstrip())
+        terminated = _TERMINATED.search(text, start, end) is not None
+        pos = lo
+        for match in _SENTENCE_BREAK.finditer(text, lo, hi):
+            sentence_end, next_pos = match.span()
+            yield pos, sentence_end, text[pos:sentence_end]
+            pos = next_pos
+        yield pos, hi, text[pos:hi] if terminated else text[pos:hi] + '.'
+
+    def iter_chunks(self, text: str) -> Iterator[Chunk]:
+        """Lazily yield chunks with their ``(start, end)`` span in ``text``.
+
+        The chunk strings are exactly those returned by ``chunk_text``;
+        the span runs from the first to the last source sentence a chunk
+        was built from.
+        """
         if not text:
-            return []
+            return
 
-        chunks: List[str] = []
-        current_chunk = ""
-        current_sentences: List[str] = []
-        blocks = self.split_by_paragraphs(text)
+        # The current chunk is kept as a list of pieces plus a running
+        # length so growing it never copies the text built so far.
+        parts: List[str] = []
+        length = 0
+        ends_with_space = False
+        current_sentences: List[Tuple[int, int, str]] = []
 
-        for block in blocks:
+        for start, end in self._iter_paragraph_spans(text):
+            block = text[start:end]
             if not block.strip():
                 continue
 
             if len(block) <= self.max_chunk_size:
-                if current_chunk:
-                    chunks.append(current_chunk)
-                    current_chunk = ""
-                    current_sentences = []
-                chunks.append(block)
+                if length:
+                    yield Chunk(current_sentences[0][0], current_sentences[-1][1], "".join(parts))
+                    parts, length, current_sentences = [], 0, []
+                yield Chunk(start, end, block)
                 continue
 
-            sentences = self.split_to_sentences(block)
-            for sentence in sentences:
-                if len(current_chunk) + len(sentence) > self.max_chunk_size and current_chunk:
-                    chunks.append(current_chunk)
+            for sentence in self._iter_sentences(text, start, end, block):
+                sentence_text = sentence[2]
+                if length + len(sentence_text) > self.max_chunk_size and length:
+                    yield Chunk(current_sentences[0][0], current_sentences[-1][1], "".join(parts))
                     n = min(self.overlap_sentences, len(current_sentences))
                     overlap = current_sentences[-n:]
-                    current_chunk = " ".join(s.strip() for s in overlap)
+                    joined = " ".join(s[2].strip() for s in overlap)
+                    parts, length = [joined], len(joined)
+                    ends_with_space = joined.endswith(" ")
                     current_sentences = overlap.copy()
 
-                sep = " " if current_chunk and not current_chunk.endswith(" ") else ""
-                current_chunk += sep + sentence
+                if length and not ends_with_space:
+                    parts.append(" ")
+                    length += 1
+                parts.append(sentence_text)
+                length += len(sentence_text)
+                if sentence_text:
+                    ends_with_space = sentence_text.endswith(" ")
                 current_sentences.append(sentence)
 
-        if current_chunk:
-            chunks.append(current_chunk)
+        if length:
+            yield Chunk(current_sentences[0][0], current_sentences[-1][1], "".join(parts))
 
-        return chunks
+    def chunk_text(self, text: str) -> List[str]:
+        return [chunk.text for chunk in self.iter_chunks(text)]
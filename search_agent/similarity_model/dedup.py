@@ -0,0 +1,103 @@
+import re
+import zlib
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+_WORD = re.compile(r"\w+")
+
+
+class MinHasher:
+    """MinHash signatures of word shingles.
+
+    Each of the ``num_perm`` hash functions is a multiply-shift hash of
+    the shingle's CRC32, so a signature is one vectorized min over a
+    (shingles x num_perm) matrix, and the same text gets the same
+    signature in every process.
+    """
+
+    def __init__(self, num_perm: int = 64, shingle_size: int = 3, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self._a = rng.integers(1, 2 ** 63, size=num_perm, dtype=np.uint64) | np.uint64(1)
+        self._b = rng.integers(0, 2 ** 63, size=num_perm, dtype=np.uint64)
+
+    def signature(self, tokens: List[str]) -> np.ndarray:
+        size = self.shingle_size
+        if len(tokens) > size:
+            shingles = {" ".join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)}
+        else:
+            shingles = {" ".join(tokens)}
+        hashes = np.fromiter((zlib.crc32(shingle.encode()) for shingle in shingles),
+                             dtype=np.uint64, count=len(shingles))
+        with np.errstate(over="ignore"):
+            mixed = hashes[:, None] * self._a + self._b
+        return (mixed >> np.uint64(32)).min(axis=0).astype(np.uint32)
+
+
+class NearDuplicateFilter:
+    """Detects exact and near-duplicate texts as they are added.
+
+    Texts are compared on their lower-cased word sequence. Exact copies
+    are found through a dictionary, near copies by the Jaccard similarity
+    of their word shingles, estimated from MinHash signatures. Signatures
+    are split into ``bands`` bands that are indexed in hash tables (LSH),
+    so a text is only compared with the earlier texts that share a whole
+    band with it, and adding n texts costs roughly linear time. With the
+    defaults, a pair at the ``threshold`` of 0.8 shares a band with
+    probability above 0.999, while one at 0.3 does so only about 12% of
+    the time and is then rejected by the signature comparison.
+    """
+
+    def __init__(self, threshold: float = 0.8, num_perm: int = 64, bands: int = 16,
+                 shingle_size: int = 3):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.bands = bands
+        self._rows = num_perm // bands
+        self._hasher = MinHasher(num_perm=num_perm, shingle_size=shingle_size)
+        self._exact: Dict[str, int] = {}
+        self._signatures: List[np.ndarray] = []
+        self._tables: List[Dict[bytes, List[int]]] = [{} for _ in range(bands)]
+        self.duplicates = 0
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        rows = self._rows
+        return [signature[band * rows:(band + 1) * rows].tobytes() for band in range(self.bands)]
+
+    def add(self, text: str) -> Tuple[int, bool]:
+        """Return ``(id, is_new)``; a duplicate gets the id of the earlier text it copies."""
+        tokens = _WORD.findall(text.lower())
+        normalized = " ".join(tokens)
+        found = self._exact.get(normalized)
+        if found is not None:
+            self.duplicates += 1
+            return found, False
+
+        signature = self._hasher.signature(tokens)
+        keys = self._band_keys(signature)
+        checked = set()
+        for table, key in zip(self._tables, keys):
+            for candidate in table.get(key, ()):
+                if candidate in checked:
+                    continue
+                checked.add(candidate)
+                if np.mean(self._signatures[candidate] == signature) >= self.threshold:
+                    self.duplicates += 1
+                    return candidate, False
+
+        new_id = len(self._signatures)
+        self._signatures.append(signature)
+        self._exact[normalized] = new_id
+        for table, key in zip(self._tables, keys):
+            table.setdefault(key, []).append(new_id)
+        return new_id, True
+
+    def filter(self, texts: List[str]) -> List[str]:
+        """Texts that are not copies of an earlier text (from this or a previous call)."""
+        return [text for text in texts if self.add(text)[1]]
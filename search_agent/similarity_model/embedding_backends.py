@@ -0,0 +1,106 @@
+import inspect
+import os
+from dataclasses import dataclass
+from typing import Any, List, Optional
+
+import numpy as np
+
+BACKENDS = ("torch",)
+
+
+@dataclass(frozen=True)
+class EmbeddingBackendConfig:
+    """How the embedding model is run.
+
+    ``backend`` is ``"torch"`` (SentenceTransformer on PyTorch), the only
+    backend so far. ``quantize`` applies dynamic int8 quantization to the
+    linear layers. ``truncate_dim`` keeps only the first dimensions of
+    every embedding (Matryoshka truncation) and renormalizes them.
+
+    int8 quantization is experimental: it has not been checked against the
+    default model's retrieval quality, so run benchmarks/bench_embeddings.py
+    before switching to it.
+    """
+    backend: str = "torch"
+    quantize: bool = False
+    truncate_dim: Optional[int] = None
+
+    def __post_init__(self):
+        if self.backend not in BACKENDS:
+            raise ValueError(f"Unknown embedding backend {self.backend!r}; expected one of {BACKENDS}")
+        if self.truncate_dim is not None and self.truncate_dim <= 0:
+            raise ValueError("truncate_dim must be positive")
+
+    @classmethod
+    def from_env(cls) -> 'EmbeddingBackendConfig':
+        """Read EMBED_BACKEND, EMBED_QUANTIZE and EMBED_DIM; unset means the defaults."""
+        dim = os.getenv("EMBED_DIM")
+        return cls(
+            backend=os.getenv("EMBED_BACKEND", "torch").lower(),
+            quantize=os.getenv("EMBED_QUANTIZE", "").lower() in ("1", "true", "yes", "int8"),
+            truncate_dim=int(dim) if dim else None,
+        )
+
+    @property
+    def is_default(self) -> bool:
+        return self.backend == "torch" and not self.quantize and self.truncate_dim is None
+
+    def model_id(self, model_name: str) -> str:
+        """Name under which this model's vectors are cached; the default backend keeps the plain name."""
+        if self.is_default:
+            return model_name
+        parts = [model_name, self.backend]
+        if self.quantize:
+            parts.append("int8")
+        if self.truncate_dim is not None:
+            parts.append(f"d{self.truncate_dim}")
+        return "@".join(parts)
+
+
+class EmbeddingModel:
+    """Wraps a loaded model so every backend has the same ``encode(texts, task=...)``.
+
+    ``task`` (e.g. jina-embeddings-v3's "text-matching" adapter) is only
+    forwarded to models whose ``encode`` accepts it, so plain encoders
+    without task adapters can be used too.
+
+    With ``truncate_dim``, embeddings are cut to that many dimensions and
+    renormalized, which is how Matryoshka-trained models are meant to be
+    shortened.
+    """
+
+    def __init__(self, model: Any, truncate_dim: Optional[int] = None):
+        self.model = model
+        self.truncate_dim = truncate_dim
+        try:
+            parameters = inspect.signature(model.encode).parameters.values()
+            self._accepts_task = any(p.name == "task" or p.kind is p.VAR_KEYWORD for p in parameters)
+        except (TypeError, ValueError):
+            self._accepts_task = False
+
+    def encode(self, texts: List[str], task: Optional[str] = None, **kwargs) -> np.ndarray:
+        if task is not None and self._accepts_task:
+            kwargs["task"] = task
+        embs = np.asarray(self.model.encode(texts, **kwargs), dtype=np.float32)
+        if self.truncate_dim is None or embs.ndim != 2 or embs.shape[1] <= self.truncate_dim:
+            return embs
+        embs = embs[:, :self.truncate_dim]
+        norms = np.linalg.norm(embs, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return embs / norms
+
+
+def _load_torch(model_name: str, config: EmbeddingBackendConfig):
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(model_name, trust_remote_code=True)
+    if config.quantize:
+        import torch
+
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model
+
+
+def load_embedding_model(model_name: str, config: Optional[EmbeddingBackendConfig] = None) -> EmbeddingModel:
+    config = config or EmbeddingBackendConfig()
+    return EmbeddingModel(_load_torch(model_name, config), truncate_dim=config.truncate_dim)
@@ -0,0 +1,154 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "search_agent", "embeddings")
+
+
+def embedding_key(model_name: str, task: str, text: str) -> str:
+    digest = hashlib.sha256()
+    for part in (model_name, task, text):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def default_cache_path(model_name: str) -> str:
+    return os.path.join(DEFAULT_CACHE_DIR, re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name))
+
+
+class EmbeddingCache:
+    """Content-addressed embedding store.
+
+    Vectors live in a fixed-capacity memory-mapped ``.npy`` file used as a
+    ring buffer, with a SQLite index mapping keys to rows and an in-RAM LRU
+    layer in front of it. The vector dimension is fixed by the first write.
+    """
+
+    def __init__(self,
+                 path: str,
+                 capacity: int = 50_000,
+                 memory_items: int = 10_000):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.capacity = capacity
+        self.memory_items = memory_items
+        self.hits = 0
+        self.misses = 0
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._vectors: Optional[np.ndarray] = None
+        self._conn = sqlite3.connect(os.path.join(path, "index.sqlite3"), check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, row INTEGER NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_row ON entries (row)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self._conn.commit()
+        self._open_vectors()
+
+    @property
+    def _vectors_file(self) -> str:
+        return os.path.join(self.path, "vectors.npy")
+
+    def _open_vectors(self) -> None:
+        if not os.path.exists(self._vectors_file):
+            return
+        vectors = np.load(self._vectors_file, mmap_mode="r+")
+        if vectors.shape[0] != self.capacity:
+            self._reset()
+            return
+        self._vectors = vectors
+
+    def _create_vectors(self, dim: int) -> None:
+        self._vectors = np.lib.format.open_memmap(
+            self._vectors_file, mode="w+", dtype=np.float32, shape=(self.capacity, dim)
+        )
+
+    def _reset(self) -> None:
+        self._vectors = None
+        self._memory.clear()
+        self._conn.execute("DELETE FROM entries")
+        self._conn.execute("DELETE FROM meta")
+        self._conn.commit()
+        if os.path.exists(self._vectors_file):
+            os.remove(self._vectors_file)
+
+    def _meta(self, name: str, default: int = 0) -> int:
+        row = self._conn.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else default
+
+    def _remember(self, key: str, vector: np.ndarray) -> None:
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, np.ndarray]:
+        found: Dict[str, np.ndarray] = {}
+        with self._lock:
+            on_disk: List[str] = []
+            for key in keys:
+                if key in found:
+                    continue
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = vector
+                else:
+                    on_disk.append(key)
+
+            if on_disk and self._vectors is not None:
+                for start in range(0, len(on_disk), 500):
+                    batch = on_disk[start:start + 500]
+                    rows = self._conn.execute(
+                        f"SELECT key, row FROM entries WHERE key IN ({','.join('?' * len(batch))})", batch
+                    ).fetchall()
+                    for key, row in rows:
+                        vector = np.array(self._vectors[row])
+                        self._remember(key, vector)
+                        found[key] = vector
+
+            hits = sum(1 for key in keys if key in found)
+            self.hits += hits
+            self.misses += len(keys) - hits
+        return found
+
+    def put_many(self, keys: Sequence[str], vectors: np.ndarray) -> None:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim != 2 or len(keys) != vectors.shape[0]:
+            raise ValueError("keys and vectors must have matching lengths")
+        with self._lock:
+            if self._vectors is not None and self._vectors.shape[1] != vectors.shape[1]:
+                self._reset()
+            if self._vectors is None:
+                self._create_vectors(vectors.shape[1])
+
+            next_row = self._meta("next_row")
+            for key, vector in zip(keys, vectors):
+                self._remember(key, vector)
+                if self._conn.execute("SELECT 1 FROM entries WHERE key = ?", (key,)).fetchone():
+                    continue
+                row = next_row % self.capacity
+                self._conn.execute("DELETE FROM entries WHERE row = ?", (row,))
+                self._conn.execute("INSERT INTO entries VALUES (?, ?)", (key, row))
+                self._vectors[row] = vector
+                next_row = row + 1
+
+            self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('next_row', ?)", (next_row,))
+            self._conn.commit()
+            self._vectors.flush()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._reset()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._vectors is not None:
+                self._vectors.flush()
+            self._conn.close()
@@ -0,0 +1,164 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Deque, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+
+class _Request:
+    def __init__(self, texts: List[str], group: Hashable):
+        self.texts = texts
+        self.group = group
+        self.future: Future = Future()
+        self.rows: List[Optional[np.ndarray]] = [None] * len(texts)
+        self.remaining = len(texts)
+
+
+class EmbeddingService:
+    """Serves ``encode`` calls from many threads with one model and dynamic batches.
+
+    Callers block in ``encode`` while a single worker thread runs the
+    model. The worker collects texts from all waiting callers until
+    ``max_batch_size`` texts are queued or ``max_wait`` seconds have passed
+    since the oldest one arrived. It then sorts them by length and encodes
+    them in batches of similar-length texts, so little work goes into
+    padding, and hands every caller its own rows in order. Only texts
+    encoded with the same ``task`` and options share a batch.
+
+    The service has the model's ``encode(texts, task=...)`` signature, so
+    it can be passed to SimilaritySearch as its model.
+    """
+
+    def __init__(self,
+                 model: Any,
+                 max_batch_size: int = 64,
+                 max_wait: float = 0.005,
+                 max_batch_chars: Optional[int] = 64_000):
+        self.model = model
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait
+        self.max_batch_chars = max_batch_chars
+        self._pending: Deque[Tuple[_Request, int, float]] = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._batches = 0
+        self._texts = 0
+        self._requests = 0
+        self._padded_chars = 0
+        self._text_chars = 0
+        self._busy_time = 0.0
+        self._batch_sizes: Deque[int] = deque(maxlen=1000)
+        self._thread = threading.Thread(target=self._run, name="embedding-service", daemon=True)
+        self._thread.start()
+
+    def encode(self, texts: List[str], task: Optional[str] = None, **kwargs) -> np.ndarray:
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        group = (task, tuple(sorted(kwargs.items())))
+        request = _Request(list(texts), group)
+        now = time.monotonic()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Embedding service is closed")
+            self._requests += 1
+            self._pending.extend((request, row, now) for row in range(len(texts)))
+            self._cond.notify()
+        return request.future.result()
+
+    def _next_batch(self) -> Optional[List[Tuple[_Request, int]]]:
+        """Wait for work and take every pending text of the oldest text's group."""
+        with self._cond:
+            while not self._pending:
+                if self._closed:
+                    return None
+                self._cond.wait()
+            deadline = self._pending[0][2] + self.max_wait
+            while len(self._pending) < self.max_batch_size and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            group = self._pending[0][0].group
+            taken = [(request, row) for request, row, _ in self._pending if request.group == group]
+            self._pending = deque(item for item in self._pending if item[0].group != group)
+            return taken
+
+    def _buckets(self, items: List[Tuple[_Request, int]]) -> List[List[Tuple[_Request, int]]]:
+        items = sorted(items, key=lambda item: len(item[0].texts[item[1]]))
+        buckets, current = [], []
+        for item in items:
+            length = len(item[0].texts[item[1]])
+            # Items are sorted, so every text is padded to the newest one's length.
+            too_wide = (self.max_batch_chars is not None and current
+                        and length * (len(current) + 1) > self.max_batch_chars)
+            if len(current) >= self.max_batch_size or too_wide:
+                buckets.append(current)
+                current = []
+            current.append(item)
+        if current:
+            buckets.append(current)
+        return buckets
+
+    def _run(self) -> None:
+        while True:
+            items = self._next_batch()
+            if items is None:
+                return
+            task, options = items[0][0].group
+            for bucket in self._buckets(items):
+                texts = [request.texts[row] for request, row in bucket]
+                kwargs = dict(options)
+                if task is not None:
+                    kwargs["task"] = task
+                start = time.perf_counter()
+                try:
+                    embs = np.asarray(self.model.encode(texts, **kwargs))
+                    if len(embs) != len(texts):
+                        raise RuntimeError(f"Model returned {len(embs)} embeddings for {len(texts)} texts")
+                except Exception as e:
+                    for request in {request for request, _ in bucket}:
+                        if not request.future.done():
+                            request.future.set_exception(e)
+                    continue
+                elapsed = time.perf_counter() - start
+                lengths = [len(text) for text in texts]
+                with self._cond:
+                    self._batches += 1
+                    self._texts += len(texts)
+                    self._text_chars += sum(lengths)
+                    self._padded_chars += max(lengths) * len(lengths)
+                    self._busy_time += elapsed
+                    self._batch_sizes.append(len(texts))
+                for (request, row), emb in zip(bucket, embs):
+                    if request.future.done():
+                        continue
+                    request.rows[row] = emb
+                    request.remaining -= 1
+                    if request.remaining == 0:
+                        request.future.set_result(np.stack(request.rows))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            sizes = sorted(self._batch_sizes)
+            return {
+                "requests": self._requests,
+                "texts": self._texts,
+                "batches": self._batches,
+                "queued": len(self._pending),
+                "mean_batch_size": self._texts / self._batches if self._batches else 0.0,
+                "batch_size_p50": sizes[len(sizes) // 2] if sizes else None,
+                "padding_ratio": 1 - self._text_chars / self._padded_chars if self._padded_chars else 0.0,
+                "busy_s": self._busy_time,
+            }
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            pending, self._pending = self._pending, deque()
+            self._cond.notify_all()
+        for request in {request for request, _, _ in pending}:
+            if not request.future.done():
+                request.future.set_exception(RuntimeError("Embedding service is closed"))
+        self._thread.join()
@@ -0,0 +1,249 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import numpy as np
+
+DEFAULT_INDEX_DIR = os.path.join(os.path.expanduser("~"), ".cache", "search_agent", "knowledge")
+
+
+@dataclass
+class IndexHit:
+    chunk_id: int
+    url: str
+    text: str
+    score: float
+    fetched_at: float
+
+
+def default_index_path(model_name: str) -> str:
+    return os.path.join(DEFAULT_INDEX_DIR, re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name))
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _spherical_kmeans(x: np.ndarray, k: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centroids = x[rng.choice(len(x), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        assign = np.argmax(x @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, x)
+        empty = ~sums.any(axis=1)
+        sums[empty] = centroids[empty]
+        centroids = _normalize(sums)
+    return centroids
+
+
+class KnowledgeIndex:
+    """Persistent store of chunks and embeddings with an IVF index.
+
+    Chunks are kept in SQLite and mirrored in memory. Once the store holds
+    ``min_train_size`` chunks, the normalized vectors are clustered with
+    spherical k-means into about sqrt(N) inverted lists, and a search
+    only scores the chunks in the ``n_probe`` lists closest to the query.
+    Smaller stores are searched exhaustively. Inserts go straight into
+    their nearest list, and the lists are retrained once the store has
+    doubled in size since the last training.
+    """
+
+    def __init__(self,
+                 path: str,
+                 n_probe: int = 8,
+                 min_train_size: int = 1024,
+                 train_sample_size: int = 20_000):
+        os.makedirs(path, exist_ok=True)
+        self.n_probe = n_probe
+        self.min_train_size = min_train_size
+        self.train_sample_size = train_sample_size
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(os.path.join(path, "chunks.sqlite3"), check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            " id INTEGER PRIMARY KEY,"
+            " url TEXT NOT NULL,"
+            " text TEXT NOT NULL,"
+            " fetched_at REAL NOT NULL,"
+            " vector BLOB NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS chunks_url ON chunks (url)")
+        self._conn.commit()
+
+        self._ids: List[int] = []
+        self._urls: List[str] = []
+        self._texts: List[str] = []
+        self._vectors = np.empty((0, 0), dtype=np.float32)
+        self._fetched_at = np.empty(0, dtype=np.float64)
+        self._alive = np.empty(0, dtype=bool)
+        self._dead = 0
+        self._rows_by_url: Dict[str, List[int]] = {}
+        self._centroids: Optional[np.ndarray] = None
+        self._lists: List[List[int]] = []
+        self._trained_size = 0
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self._ids) - self._dead
+
+    @property
+    def dim(self) -> int:
+        return self._vectors.shape[1] if len(self._ids) else 0
+
+    def _load(self) -> None:
+        rows = self._conn.execute("SELECT id, url, text, fetched_at, vector FROM chunks ORDER BY id").fetchall()
+        if not rows:
+            return
+        vectors = np.stack([np.frombuffer(blob, dtype=np.float32) for *_, blob in rows])
+        self._append_rows([r[0] for r in rows], [r[1] for r in rows], [r[2] for r in rows],
+                          [r[3] for r in rows], vectors)
+        self._maybe_train()
+
+    def _append_rows(self, ids, urls, texts, fetched_at, vectors: np.ndarray) -> List[int]:
+        start = len(self._ids)
+        needed = start + len(ids)
+        if self._vectors.shape[0] < needed:
+            capacity = max(needed, 2 * self._vectors.shape[0], 64)
+            grown = np.empty((capacity, vectors.shape[1]), dtype=np.float32)
+            if start:
+                grown[:start] = self._vectors[:start]
+            self._vectors = grown
+            self._fetched_at = np.resize(self._fetched_at, capacity)
+            self._alive = np.resize(self._alive, capacity)
+        self._vectors[start:needed] = _normalize(vectors)
+        self._fetched_at[start:needed] = fetched_at
+        self._alive[start:needed] = True
+        self._ids.extend(ids)
+        self._urls.extend(urls)
+        self._texts.extend(texts)
+        rows = list(range(start, needed))
+        for row, url in zip(rows, urls):
+            self._rows_by_url.setdefault(url, []).append(row)
+        return rows
+
+    def _maybe_train(self) -> None:
+        size = len(self)
+        if size < self.min_train_size:
+            return
+        if self._centroids is not None and size < 2 * self._trained_size:
+            return
+        self._compact()
+        live = self._vectors[:len(self._ids)]
+        n_lists = max(1, int(np.sqrt(len(live))))
+        rng = np.random.default_rng(len(live))
+        sample = live if len(live) <= self.train_sample_size else \
+            live[rng.choice(len(live), size=self.train_sample_size, replace=False)]
+        self._centroids = _spherical_kmeans(sample, min(n_lists, len(sample)))
+        self._lists = [[] for _ in range(len(self._centroids))]
+        for start in range(0, len(live), 8192):
+            assign = np.argmax(live[start:start + 8192] @ self._centroids.T, axis=1)
+            for offset, list_id in enumerate(assign):
+                self._lists[list_id].append(start + offset)
+        self._trained_size = len(live)
+
+    def _compact(self) -> None:
+        if not self._dead:
+            return
+        keep = np.flatnonzero(self._alive[:len(self._ids)])
+        vectors = self._vectors[keep]
+        fetched_at = self._fetched_at[keep]
+        ids = [self._ids[r] for r in keep]
+        urls = [self._urls[r] for r in keep]
+        texts = [self._texts[r] for r in keep]
+        self._ids, self._urls, self._texts = [], [], []
+        self._vectors = np.empty((0, vectors.shape[1]), dtype=np.float32)
+        self._fetched_at = np.empty(0, dtype=np.float64)
+        self._alive = np.empty(0, dtype=bool)
+        self._dead = 0
+        self._rows_by_url = {}
+        self._append_rows(ids, urls, texts, fetched_at, vectors)
+
+    def add(self, url: str, chunks: List[str], embeddings: np.ndarray, fetched_at: Optional[float] = None) -> None:
+        """Store the chunks of one page, replacing whatever was stored for ``url``."""
+        if not chunks:
+            return
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if self.dim and embeddings.shape[1] != self.dim:
+            raise ValueError(f"Embedding dimension {embeddings.shape[1]} does not match index dimension {self.dim}")
+        if fetched_at is None:
+            fetched_at = time.time()
+        with self._lock:
+            self.delete_url(url)
+            self._conn.executemany(
+                "INSERT INTO chunks (url, text, fetched_at, vector) VALUES (?, ?, ?, ?)",
+                [(url, text, fetched_at, vector.tobytes()) for text, vector in zip(chunks, embeddings)],
+            )
+            self._conn.commit()
+            ids = [row[0] for row in self._conn.execute(
+                "SELECT id FROM chunks WHERE url = ? ORDER BY id", (url,)
+            ).fetchall()]
+            rows = self._append_rows(ids, [url] * len(ids), list(chunks), [fetched_at] * len(ids), embeddings)
+            if self._centroids is not None:
+                assign = np.argmax(self._vectors[rows] @ self._centroids.T, axis=1)
+                for row, list_id in zip(rows, assign):
+                    self._lists[list_id].append(row)
+            self._maybe_train()
+
+    def delete_url(self, url: str) -> int:
+        with self._lock:
+            rows = self._rows_by_url.pop(url, [])
+            if not rows:
+                return 0
+            self._alive[rows] = False
+            self._dead += len(rows)
+            self._conn.execute("DELETE FROM chunks WHERE url = ?", (url,))
+            self._conn.commit()
+            if self._dead > len(self._ids) // 4:
+                # Row positions change on compaction, so the lists are rebuilt.
+                self._centroids = None
+                self._lists = []
+                self._trained_size = 0
+                self._compact()
+                self._maybe_train()
+            return len(rows)
+
+    def fetched_at(self, url: str) -> Optional[float]:
+        rows = self._rows_by_url.get(url)
+        return float(self._fetched_at[rows].min()) if rows else None
+
+    def search(self, query_emb: np.ndarray, top_k: int, max_age: Optional[float] = None) -> List[IndexHit]:
+        with self._lock:
+            if not len(self) or top_k <= 0:
+                return []
+            query = _normalize(np.asarray(query_emb).reshape(-1))
+            if self._centroids is None:
+                candidates = np.arange(len(self._ids))
+            else:
+                n_probe = min(self.n_probe, len(self._centroids))
+                probe = np.argpartition(-(self._centroids @ query), n_probe - 1)[:n_probe]
+                candidates = np.fromiter(
+                    (row for list_id in probe for row in self._lists[list_id]), dtype=np.int64
+                )
+            candidates = candidates[self._alive[candidates]]
+            if max_age is not None:
+                candidates = candidates[self._fetched_at[candidates] >= time.time() - max_age]
+            if not candidates.size:
+                return []
+
+            scores = self._vectors[candidates] @ query
+            k = min(top_k, len(candidates))
+            best = np.argpartition(-scores, k - 1)[:k]
+            best = best[np.argsort(-scores[best], kind="stable")]
+            return [
+                IndexHit(chunk_id=self._ids[candidates[i]], url=self._urls[candidates[i]],
+                         text=self._texts[candidates[i]], score=float(scores[i]),
+                         fetched_at=float(self._fetched_at[candidates[i]]))
+                for i in best
+            ]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,76 @@
+import math
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+_TOKEN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(text.lower())
+
+
+class BM25Index:
+    """In-memory Okapi BM25 over a fixed list of documents.
+
+    The index is a term -> (document ids, term frequencies) inverted
+    list, so scoring a query only touches the postings of its own terms.
+    """
+
+    def __init__(self, documents: Sequence[str], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.size = len(documents)
+        lengths = np.zeros(self.size, dtype=np.float32)
+        postings: Dict[str, Tuple[List[int], List[int]]] = {}
+        for doc_id, document in enumerate(documents):
+            counts = Counter(tokenize(document))
+            lengths[doc_id] = sum(counts.values())
+            for term, tf in counts.items():
+                ids, tfs = postings.setdefault(term, ([], []))
+                ids.append(doc_id)
+                tfs.append(tf)
+        avg_length = float(lengths.mean()) if self.size and lengths.any() else 1.0
+        # Per-document part of the BM25 denominator.
+        self._norm = k1 * (1 - b + b * lengths / avg_length)
+        self._postings = {
+            term: (np.array(ids, dtype=np.int64), np.array(tfs, dtype=np.float32))
+            for term, (ids, tfs) in postings.items()
+        }
+
+    def __len__(self) -> int:
+        return self.size
+
+    def idf(self, term: str) -> float:
+        df = len(self._postings[term][0]) if term in self._postings else 0
+        return math.log(1 + (self.size - df + 0.5) / (df + 0.5))
+
+    def scores(self, query: str) -> np.ndarray:
+        scores = np.zeros(self.size, dtype=np.float32)
+        for term, query_tf in Counter(tokenize(query)).items():
+            posting = self._postings.get(term)
+            if posting is None:
+                continue
+            ids, tfs = posting
+            scores[ids] += query_tf * self.idf(term) * tfs * (self.k1 + 1) / (tfs + self._norm[ids])
+        return scores
+
+
+def top_n_ids(scores: np.ndarray, n: int, among: Optional[Sequence[int]] = None) -> np.ndarray:
+    """Ids of the ``n`` highest ``scores`` (restricted to ``among``, if given), in id order."""
+    ids = np.arange(len(scores)) if among is None else np.asarray(among, dtype=np.int64)
+    if n >= len(ids):
+        return ids
+    best = np.argpartition(-scores[ids], n - 1)[:n]
+    return ids[np.sort(best)]
+
+
+def fuse_scores(dense: np.ndarray, lexical: np.ndarray, weight: float) -> np.ndarray:
+    """Blend cosine scores with BM25 scores rescaled to [0, 1]; ``weight`` is the lexical share."""
+    if weight <= 0 or lexical.size == 0:
+        return dense
+    spread = float(lexical.max() - lexical.min())
+    scaled = (lexical - lexical.min()) / spread if spread > 0 else np.zeros_like(lexical)
+    return (1 - weight) * dense + weight * scaled
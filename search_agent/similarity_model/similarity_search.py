@@ -1,11 +1,24 @@
-from sentence_transformers import SentenceTransformer
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from typing import List, Tuple
+from typing import Any, Dict, List, Optional, Tuple
+
+from .embedding_backends import EmbeddingBackendConfig, EmbeddingModel, load_embedding_model
+from .embedding_cache import EmbeddingCache, embedding_key
+from .lexical import BM25Index, fuse_scores, top_n_ids
 
 class SimilaritySearch:
-    def __init__(self, model_name: str):
-        self.model = SentenceTransformer(model_name, trust_remote_code=True)
+    def __init__(self, model_name: str, embedding_cache: Optional[EmbeddingCache] = None, model: Optional[Any] = None,
+                 backend: Optional[EmbeddingBackendConfig] = None):
+        self.model_name = model_name
+        self.backend = backend or EmbeddingBackendConfig()
+        # Vectors from different backends or dimensions must never share cache entries.
+        self.model_id = self.backend.model_id(model_name)
+        if model is None:
+            model = load_embedding_model(model_name, self.backend)
+        elif self.backend.truncate_dim is not None:
+            model = EmbeddingModel(model, truncate_dim=self.backend.truncate_dim)
+        self.model = model
+        self.embedding_cache = embedding_cache
+        self.last_cache_stats: Dict[str, int] = {"hits": 0, "misses": 0}
 
     def get_embedding(self, texts: List[str]) -> np.ndarray:
         try:
@@ -15,31 +28,99 @@ class SimilaritySearch:
             print(f"Error generating embeddings: {e}")
             return np.empty((0, 0))
 
-    def calculate_scores(self, query: str, documents: List[str]) -> np.ndarray:
-        try:
-            query_emb = self.get_embedding([query])           
-            doc_embs = self.get_embedding(documents)         
+    def embed_documents(self, texts: List[str]) -> np.ndarray:
+        if self.embedding_cache is None or not texts:
+            self.last_cache_stats = {"hits": 0, "misses": len(texts)}
+            return self.get_embedding(texts)
+
+        keys = [embedding_key(self.model_id, "text-matching", text) for text in texts]
+        found = self.embedding_cache.get_many(keys)
+
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+        self.last_cache_stats = {"hits": len(texts) - len(missing), "misses": len(missing)}
+
+        if missing:
+            new_embs = self.get_embedding(list(missing.values()))
+            if new_embs.size == 0:
+                return np.empty((0, 0))
+            self.embedding_cache.put_many(list(missing), new_embs)
+            found.update(zip(missing, new_embs))
+
+        return np.stack([found[key] for key in keys])
+
+    @staticmethod
+    def _normalize(embs: np.ndarray) -> np.ndarray:
+        embs = np.asarray(embs, dtype=np.float32)
+        norms = np.linalg.norm(embs, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return embs / norms
+
+    def score_matrix(self, query_embs: np.ndarray, doc_embs: np.ndarray) -> np.ndarray:
+        """Cosine similarity of every query (rows) against every document (columns)."""
+        if query_embs.size == 0 or doc_embs.size == 0:
+            return np.empty((0, 0))
+        return self._normalize(query_embs) @ self._normalize(doc_embs).T
+
+    def score_embeddings(self, query_emb: np.ndarray, doc_embs: np.ndarray) -> np.ndarray:
+        if query_emb.size == 0 or doc_embs.size == 0:
+            return np.array([])
+        return self.score_matrix(query_emb, doc_embs)[0]
+
+    def calculate_scores(self,
+                         query: str,
+                         documents: List[str],
+                         lexical_top_n: Optional[int] = None,
+                         lexical_weight: float = 0.0) -> np.ndarray:
+        """Cosine score of every document against ``query``.
 
-            if query_emb.size == 0 or doc_embs.size == 0:
-                return np.array([])
+        With ``lexical_top_n``, only the documents with the best BM25
+        scores are embedded, and the rest score -inf. A positive
+        ``lexical_weight`` blends the BM25 score into the dense one.
+        """
+        try:
+            query_emb = self.get_embedding([query])
+            if lexical_top_n is None and lexical_weight <= 0:
+                return self.score_embeddings(query_emb, self.embed_documents(documents))
 
-            scores = cosine_similarity(doc_embs, query_emb).flatten()
+            lexical = BM25Index(documents).scores(query)
+            candidates = np.arange(len(documents)) if lexical_top_n is None else top_n_ids(lexical, lexical_top_n)
+            dense = self.score_embeddings(query_emb, self.embed_documents([documents[i] for i in candidates]))
+            if dense.size == 0:
+                return dense
+            scores = np.full(len(documents), -np.inf, dtype=np.float32)
+            scores[candidates] = fuse_scores(dense, lexical[candidates], lexical_weight)
             return scores
         except Exception as e:
             print(f"Error calculating scores: {e}")
             return np.array([])
 
-    def rerank(self,query: str, documents: List[str], top_k: int) -> Tuple[List[int], List[float]]:
-
-        scores = self.calculate_scores(query, documents)
+    def select_top_k(self, scores: np.ndarray, top_k: int) -> Tuple[List[int], List[float]]:
         if scores.size == 0:
             return [], []
 
-        top_k = min(top_k, len(scores))
-        sorted_indices = np.argsort(scores)[::-1][:top_k]
+        # Documents scored -inf were filtered out and are never selected.
+        top_k = min(top_k, len(scores) - int(np.count_nonzero(scores == -np.inf)))
+        if top_k <= 0:
+            return [], []
+        if top_k < len(scores):
+            kth = scores[np.argpartition(scores, len(scores) - top_k)[-top_k:]].min()
+            above = np.flatnonzero(scores > kth)
+            ties = np.flatnonzero(scores == kth)
+            candidates = np.concatenate([above, ties[len(above) - top_k:]])
+        else:
+            candidates = np.arange(len(scores))
+        # Highest score first; ties keep the order of a reversed argsort (higher index first).
+        sorted_indices = candidates[np.lexsort((-candidates, -scores[candidates]))]
         top_scores = [float(scores[i]) for i in sorted_indices]
         return sorted_indices.tolist(), top_scores
 
+    def rerank(self,query: str, documents: List[str], top_k: int,
+               lexical_top_n: Optional[int] = None, lexical_weight: float = 0.0) -> Tuple[List[int], List[float]]:
+        return self.select_top_k(self.calculate_scores(query, documents, lexical_top_n, lexical_weight), top_k)
+
     def get_retrieved_documents(self, query: str, documents: List[str], top_k: int) -> List[Tuple[str, float]]:
         indices, scores = self.rerank(query, documents, top_k)
         return [(documents[i], scores[j]) for j, i in enumerate(indices)]
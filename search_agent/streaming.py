@@ -0,0 +1,47 @@
+import contextvars
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, TypeVar
+
+T = TypeVar("T")
+
+THOUGHT = "thought"
+TOKEN = "token"
+TOOL_START = "tool_start"
+TOOL_TOKEN = "tool_token"
+TOOL_END = "tool_end"
+OBSERVATION = "observation"
+FINAL_ANSWER = "final_answer"
+
+
+@dataclass
+class AgentEvent:
+    """One step of a streamed agent run.
+
+    ``token`` events carry LLM output deltas as they arrive; ``tool_token``
+    events carry the search tool's answer while it is being generated.
+    The last event of a run is always ``final_answer``.
+    """
+    type: str
+    content: str = ""
+    data: Dict[str, Any] = field(default_factory=dict)
+
+
+def iter_in_context(events: Iterator[T]) -> Iterator[T]:
+    """Advance ``events`` inside one fixed copy of the current context.
+
+    Streaming consumers such as Gradio may pull each item from a different
+    worker thread. Running every step in the same context keeps the
+    tracing spans opened inside the generator consistent between steps.
+    """
+    ctx = contextvars.copy_context()
+    try:
+        while True:
+            try:
+                item = ctx.run(next, events)
+            except StopIteration:
+                return
+            yield item
+    finally:
+        close = getattr(events, "close", None)
+        if close is not None:
+            ctx.run(close)
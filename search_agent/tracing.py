@@ -0,0 +1,156 @@
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from typing import IO, Any, Dict, Iterator, List, Optional, Union
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str] = None
+    start_time: float = 0.0
+    duration_ms: Optional[float] = None
+    status: str = "ok"
+    error: Optional[str] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class SpanSink(ABC):
+    @abstractmethod
+    def export(self, span: Span) -> None:
+        pass
+
+
+class NullSink(SpanSink):
+    def export(self, span: Span) -> None:
+        pass
+
+
+class InMemorySink(SpanSink):
+    def __init__(self):
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        with self._lock:
+            self.spans.append(span)
+
+
+class JsonLinesSink(SpanSink):
+    """Writes one JSON object per finished span to a path or open file."""
+
+    def __init__(self, target: Union[str, IO[str]]):
+        self._owns_file = isinstance(target, str)
+        self._file = open(target, "a", encoding="utf-8") if self._owns_file else target
+        self._lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        line = json.dumps(span.to_dict(), default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self) -> None:
+        if self._owns_file:
+            self._file.close()
+
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+
+
+class Tracer:
+    """Nested spans grouped under a per-question trace ID.
+
+    The active span is tracked in a context variable, so spans opened in
+    asyncio tasks and ``asyncio.to_thread`` workers nest under the span
+    that was active when they were scheduled.
+    """
+
+    def __init__(self, sink: Optional[SpanSink] = None):
+        self.sink = sink or NullSink()
+
+    def current_span(self) -> Optional[Span]:
+        return _current_span.get()
+
+    def _new_span(self, name: str, attributes: Dict[str, Any], new_trace: bool) -> Span:
+        parent = None if new_trace else _current_span.get()
+        return Span(
+            name=name,
+            trace_id=parent.trace_id if parent else uuid.uuid4().hex,
+            span_id=uuid.uuid4().hex[:16],
+            parent_id=parent.span_id if parent else None,
+            start_time=time.time(),
+            attributes=attributes,
+        )
+
+    @contextmanager
+    def _activate(self, span: Span) -> Iterator[Span]:
+        token = _current_span.set(span)
+        start = time.perf_counter()
+        try:
+            yield span
+        except GeneratorExit:
+            # A streaming consumer stopped reading before the span finished.
+            span.status = "cancelled"
+            raise
+        except BaseException as e:
+            span.status = "error"
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.duration_ms = (time.perf_counter() - start) * 1000.0
+            _current_span.reset(token)
+            self.sink.export(span)
+
+    def trace(self, name: str, **attributes: Any):
+        """Start a new trace (e.g. one per user question) with a root span."""
+        return self._activate(self._new_span(name, attributes, new_trace=True))
+
+    def span(self, name: str, **attributes: Any):
+        """Open a child of the current span, or a new trace if there is none."""
+        return self._activate(self._new_span(name, attributes, new_trace=False))
+
+    def record(self, name: str, duration_ms: float, **attributes: Any) -> Span:
+        """Export a span for work that was timed elsewhere."""
+        span = self._new_span(name, attributes, new_trace=False)
+        span.start_time -= duration_ms / 1000.0
+        span.duration_ms = duration_ms
+        if attributes.get("error"):
+            span.status = "error"
+            span.error = str(attributes["error"])
+        self.sink.export(span)
+        return span
+
+
+def token_usage(response: Any) -> Dict[str, Optional[int]]:
+    """Token counts reported on a LangChain message or a Gemini response."""
+    usage = getattr(response, "usage_metadata", None)
+    if not usage:
+        return {}
+    if isinstance(usage, dict):
+        return {"input_tokens": usage.get("input_tokens"), "output_tokens": usage.get("output_tokens")}
+    return {
+        "input_tokens": getattr(usage, "prompt_token_count", None),
+        "output_tokens": getattr(usage, "candidates_token_count", None),
+    }
+
+
+tracer = Tracer(JsonLinesSink(os.environ["TRACE_FILE"]) if os.getenv("TRACE_FILE") else None)
+
+
+def set_sink(sink: SpanSink) -> None:
+    tracer.sink = sink
@@ -0,0 +1,39 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'search_agent')))
+
+from similarity_model.embedding_backends import EmbeddingBackendConfig, load_embedding_model
+
+SMALL_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+TEXTS = [
+    "Japan's population fell to about 124 million people.",
+    "The number of people living in Japan is around 124 million.",
+    "Bake the cookies for 10 to 12 minutes until golden.",
+]
+
+
+def test_backend_config_names_cache_entries_per_variant():
+    assert EmbeddingBackendConfig().model_id(SMALL_MODEL) == SMALL_MODEL
+    assert EmbeddingBackendConfig(quantize=True, truncate_dim=128).model_id(SMALL_MODEL) == \
+        f"{SMALL_MODEL}@torch@int8@d128"
+    with pytest.raises(ValueError):
+        EmbeddingBackendConfig(backend="onnx")
+
+
+@pytest.mark.parametrize("config", [
+    EmbeddingBackendConfig(),
+    EmbeddingBackendConfig(quantize=True),
+    EmbeddingBackendConfig(truncate_dim=128),
+], ids=["torch", "torch-int8", "torch-d128"])
+def test_small_model_loads_and_ranks_paraphrases_first(config):
+    pytest.importorskip("sentence_transformers")
+    model = load_embedding_model(SMALL_MODEL, config)
+    embs = model.encode(TEXTS)
+    assert embs.shape == (len(TEXTS), config.truncate_dim or 384)
+    embs = embs / np.linalg.norm(embs, axis=1, keepdims=True)
+    scores = embs @ embs[0]
+    assert scores[1] > scores[2]
@@ -0,0 +1,86 @@
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'search_agent')))
+
+from context_building.markdown_normalizer import MarkdownNormalizer
+
+RECIPE_PAGE = """# Chocolate chip cookies
+
+A classic chocolate chip cookie has about 78 calories, most of it from butter and sugar.
+
+Bake the cookies for 10 to 12 minutes, until the edges are golden. Let them cool before you share them.
+
+Users must sign in to the portal before they can log in to the recipe archive.
+
+Subscribe for weekly recipes by email; we send one newsletter per month.
+
+This recipe is © 2024 Jane Doe, adapted from a family notebook.
+
+Read our [privacy policy](/privacy) to learn how the data from the order form is stored.
+"""
+
+
+def test_content_mentioning_banner_words_is_kept():
+    result = MarkdownNormalizer().normalize(RECIPE_PAGE)
+    assert result.boilerplate_chars == 0
+    for sentence in ("78 calories", "Bake the cookies", "must sign in to the portal",
+                     "Subscribe for weekly recipes", "© 2024 Jane Doe", "Read our privacy policy"):
+        assert sentence in result.text
+
+
+def test_banner_blocks_are_dropped():
+    page = RECIPE_PAGE + """
+We use cookies to improve your experience. [Accept all](/accept) [Privacy policy](/privacy)
+
+Share on [Facebook](/fb) [Twitter](/tw)
+
+Sign in | Register
+
+Subscribe to our newsletter
+
+© 2024 Example Inc. All rights reserved.
+
+Advertisement
+"""
+    result = MarkdownNormalizer().normalize(page)
+    assert result.text == MarkdownNormalizer().normalize(RECIPE_PAGE).text
+    assert result.boilerplate_chars > 0
+
+
+def test_link_heavy_block_with_banner_word_is_dropped_but_plain_link_is_not():
+    normalizer = MarkdownNormalizer()
+    assert normalizer.normalize("Follow us on [Instagram](/ig) and [YouTube](/yt)").text == ""
+    kept = normalizer.normalize("The [cookie dough](/dough) can be frozen for three months.")
+    assert kept.text == "The cookie dough can be frozen for three months."
+
+
+def test_repeated_blocks_across_pages_keep_the_first_page():
+    normalizer = MarkdownNormalizer()
+    seen = set()
+    first = normalizer.normalize("Shared sidebar text.\n\nFirst page body.", seen)
+    second = normalizer.normalize("Shared sidebar text.\n\nSecond page body.", seen)
+    assert first.text == "Shared sidebar text. First page body."
+    assert second.text == "Second page body."
+
+
+def test_repeats_within_one_page_are_kept():
+    normalizer = MarkdownNormalizer()
+    result = normalizer.normalize("Step one.\n\nRinse.\n\nStep two.\n\nRinse.", set())
+    assert result.text == "Step one. Rinse. Step two. Rinse."
+
+
+def test_drop_repeats_resolves_pages_cleaned_out_of_order():
+    normalizer = MarkdownNormalizer()
+    first = normalizer.normalize("Shared sidebar text.\n\nFirst page body.")
+    second = normalizer.normalize("Shared sidebar text.\n\nSecond page body.")
+    seen = set()
+    # The second page was cleaned first, but the first page still keeps the shared block.
+    assert normalizer.drop_repeats(first, seen).text == "Shared sidebar text. First page body."
+    assert normalizer.drop_repeats(second, seen).text == "Second page body."
+
+
+def test_removed_chars_ignores_brace_escaping():
+    result = MarkdownNormalizer().normalize("Use {curly} braces.")
+    assert result.text == "Use {{curly}} braces."
+    assert result.removed_chars == 0
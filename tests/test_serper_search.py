@@ -0,0 +1,46 @@
+import os
+import sys
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(project_root)
+sys.path.append(os.path.join(project_root, 'search_agent'))
+
+from benchmarks.servers import load_fixtures, start_serper_server
+from search.serper_search import CachedSearchAPI, SerperAPI, SerperConfig
+
+
+def _serper(server):
+    return SerperAPI(config=SerperConfig(api_key="test-key", api_url=server.url))
+
+
+def test_serper_api_against_local_server():
+    server = start_serper_server(load_fixtures(), "http://pages.test")
+    try:
+        result = _serper(server).get_sources("japan population", num_results=2)
+    finally:
+        server.close()
+    assert result.success
+    organic = result.data['organic']
+    assert len(organic) == 2
+    assert all(item['link'].startswith("http://pages.test/") for item in organic)
+    assert set(organic[0]) <= {'title', 'link', 'snippet', 'date'}
+
+
+def test_api_key_does_not_modify_the_callers_config():
+    config = SerperConfig(api_key="from-config", api_url="http://127.0.0.1:9")
+    api = SerperAPI(api_key="override", config=config)
+    assert api.config.api_key == "override"
+    assert config.api_key == "from-config"
+
+
+def test_cached_results_are_copies():
+    server = start_serper_server(load_fixtures(), "http://pages.test")
+    try:
+        cached = CachedSearchAPI(_serper(server), ttl=60)
+        first = cached.get_sources("japan population", num_results=2)
+        first.data['organic'].clear()
+        second = cached.get_sources("Japan  population", num_results=2)
+    finally:
+        server.close()
+    assert (cached.misses, cached.hits) == (1, 1)
+    assert len(second.data['organic']) == 2